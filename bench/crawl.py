@@ -0,0 +1,179 @@
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from loguru import logger
+
+from bench.fixtures import generate, load_index
+from bench.mock_site import MockSite
+from lib.dedup import DedupIndex
+from lib.fetcher import PAGE_PARAMS
+from lib.logs import VERBOSITY, set_logging
+from lib.parser import Parser
+from lib.product import Product
+from lib.settings import DEFAULT_CONFIG, Settings
+
+# end to end runs of the crawler against the local stand-in of the site:
+#   work      - Parser.work over all the categories of the fixtures: tree, listings, cards, goods outputs
+#   csv_write - categories.csv, registry and tree snapshot of the run
+#   pages     - fetching the first listing page and calc_amount_of_pages, per category
+#   card      - Product.parse one card after another, per card
+# every repeat starts with an empty output directory; the page cache, if enabled, is kept between repeats,
+# so the first repeat is a cold one and the rest are warm
+#
+# usage: python -m bench.crawl [--fixtures <directory>] [--workers 8] [--backend lxml] [--cache]
+#                              [--latency-ms 20 80] [--error-rate 0.01] [--rps 1000] [--repeat 3]
+#                              [--logging offers [--sync-logging]]
+#                              [--save result.json] [--baseline result.json --tolerance 0.15]
+
+
+def bench_settings(workdir: Path, site: MockSite, args) -> Settings:
+    config = json.loads(Path(args.config).read_text(encoding='utf-8'))
+    config.update({
+        'output_directory': str(workdir / 'out'),
+        'base_url': site.url,
+        'categories': site.categories,
+        'delay_range': [0, 0],
+        'workers': args.workers,
+        'category_workers': args.category_workers,
+        'per_host_limit': args.per_host_limit,
+        'pool_size': args.workers,
+        'max_retries': args.max_retries,
+        'rate_limit': {**config['rate_limit'], **({'initial_rps': args.rps, 'max_rps': args.rps} if args.rps else {})},
+        'journal_file': str(workdir / 'out' / 'journal.sqlite'),
+        'cache': {**config['cache'], 'enabled': args.cache, 'path': str(workdir.parent / 'cache' / 'pages.sqlite')},
+        'incremental': {**config['incremental'], 'enabled': False},
+        'parser_backend': args.backend,
+        'parse_processes': args.parse_processes,
+        'lazy_tree': False,
+        'tree': {**config['tree'], 'snapshot_file': str(workdir / 'out' / 'tree.jsonl'),
+                 'registry_file': str(workdir / 'out' / 'category_ids.json')},
+        'output': {**config['output'], **({'formats': args.formats} if args.formats else {}),
+                   'history_file': str(workdir / 'out' / 'history.sqlite')},
+        'trace_memory': False,
+        'metrics': {**config['metrics'], 'progress_s': 0, 'prometheus_port': 0},
+        'logs_dir': str(workdir / 'logs'),
+    })
+    (workdir / 'out').mkdir(parents=True, exist_ok=True)
+    path = workdir / 'config.json'
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding='utf-8')
+    return Settings(config=str(path))
+
+
+def run_once(workdir: Path, site: MockSite, cards: list[str], args) -> dict:
+    parser = Parser(settings=bench_settings(workdir, site, args))
+    parser.setup_session()
+    try:
+        started = perf_counter()
+        parser.work()
+        work_s = perf_counter() - started
+        totals = parser.metrics.totals()
+        rows = parser.goods_writer.rows
+
+        started = perf_counter()
+        parser.csv_write()
+        csv_write_s = perf_counter() - started
+
+        started = perf_counter()
+        for url in parser.required_categories_list:
+            listing = parser.get_listing_out_of_page_with_url(parser.base_url + url, params=PAGE_PARAMS,
+                                                              catalog_url=url)
+            parser.calc_amount_of_pages(listing=listing, catalog_url=url)
+        pages_ms = (perf_counter() - started) * 1000 / max(1, len(parser.required_categories_list))
+
+        dedup = DedupIndex()
+        started = perf_counter()
+        for href in cards:
+            product = Product(href, category=href.rsplit('/', 1)[0] + '/')
+            product.parse(fetcher=parser.fetcher, dedup=dedup, backend=parser.backend, base_url=parser.base_url)
+        card_ms = (perf_counter() - started) * 1000 / max(1, len(cards))
+    finally:
+        parser.close()
+    return {'work_s': work_s, 'products': totals['products'], 'products_per_s': totals['products'] / work_s,
+            'requests': totals['requests'], 'retries': totals['retries'], 'errors': totals['errors'], 'rows': rows,
+            'csv_write_s': csv_write_s, 'pages_ms': pages_ms, 'card_ms': card_ms}
+
+
+def median(results: list[dict]) -> dict:
+    return {name: statistics.median(result[name] for result in results) for name in results[0]}
+
+
+def report(name: str, result: dict):
+    print(f"{name:>8}: work {result['work_s']:7.2f} s | {result['products']:6.0f} products "
+          f"{result['products_per_s']:8.1f}/s | {result['rows']:6.0f} rows | {result['requests']:6.0f} requests, "
+          f"{result['retries']:4.0f} retries, {result['errors']:4.0f} errors | "
+          f"csv_write {result['csv_write_s']:6.3f} s | pages {result['pages_ms']:7.1f} ms/category | "
+          f"card {result['card_ms']:6.2f} ms")
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='crawler benchmark against a local stand-in of the site')
+    arguments.add_argument('--fixtures', default=None, help='fixture site directory, generated if not given')
+    arguments.add_argument('--categories', type=int, default=4, help='categories of a generated site')
+    arguments.add_argument('--pages', type=int, default=6, help='listing pages per category of a generated site')
+    arguments.add_argument('--config', default=DEFAULT_CONFIG, help='config the benchmark settings are laid over')
+    arguments.add_argument('--workers', type=int, default=8)
+    arguments.add_argument('--category-workers', type=int, default=4)
+    arguments.add_argument('--per-host-limit', type=int, default=8)
+    arguments.add_argument('--backend', default='soup')
+    arguments.add_argument('--parse-processes', type=int, default=0)
+    arguments.add_argument('--formats', nargs='+', default=None, help='output formats instead of those of the config')
+    arguments.add_argument('--cache', action='store_true', help='keep pages in the cache between repeats')
+    arguments.add_argument('--max-retries', type=int, default=3)
+    arguments.add_argument('--rps', type=float, default=1000,
+                           help='starting and highest rate of the limiter, 0 keeps the rate limit of the config')
+    arguments.add_argument('--latency-ms', type=float, nargs=2, default=(0, 0))
+    arguments.add_argument('--error-rate', type=float, default=0.0)
+    arguments.add_argument('--cards', type=int, default=100, help='cards of the Product.parse benchmark')
+    arguments.add_argument('--repeat', type=int, default=3)
+    arguments.add_argument('--save', default=None, help='write the results to a json file')
+    arguments.add_argument('--baseline', default=None, help='results to compare products per second with')
+    arguments.add_argument('--tolerance', type=float, default=0.15, help='allowed share of throughput loss')
+    arguments.add_argument('--log-level', default='WARNING')
+    arguments.add_argument('--logging', choices=VERBOSITY, default=None,
+                           help='log the way a run does, with this verbosity, instead of --log-level to stderr')
+    arguments.add_argument('--sync-logging', action='store_true', help='write the logs of --logging without a queue')
+    args = arguments.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='zoo-bench-') as tmp:
+        if args.logging:
+            set_logging(str(Path(tmp) / 'logs'), config={'verbosity': args.logging, 'enqueue': not args.sync_logging})
+        else:
+            logger.remove()
+            logger.add(sink=sys.stderr, level=args.log_level, format='{message}')
+        fixtures = Path(args.fixtures) if args.fixtures else generate(Path(tmp) / 'site', categories=args.categories,
+                                                                        pages=args.pages)
+        paths = (key.split('?')[0] for key in load_index(fixtures)['pages'])
+        cards = sorted(path for path in paths if path.endswith('.html'))[:args.cards]
+        results = []
+        with MockSite(fixtures, latency_ms=tuple(args.latency_ms), error_rate=args.error_rate) as site:
+            for repeat in range(max(1, args.repeat)):
+                results.append(run_once(Path(tmp) / f'run-{repeat}', site, cards, args))
+                report(f'run {repeat + 1}', results[-1])
+            stats = site.stats()
+        # the queued sinks are drained and closed before their directory goes
+        logger.remove()
+    result = median(results)
+    report('median', result)
+    print(f"site: {stats['requests']} requests, {stats['errors']} errors injected, {stats['misses']} unknown pages")
+
+    summary = {'settings': {name: value for name, value in vars(args).items()
+                            if name not in ('save', 'baseline', 'tolerance', 'log_level')},
+               'runs': results, 'median': result, 'site': stats}
+    if args.save:
+        Path(args.save).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))['median']
+        loss = 1 - result['products_per_s'] / baseline['products_per_s'] if baseline['products_per_s'] else 0.0
+        print(f"throughput {result['products_per_s']:.1f}/s against {baseline['products_per_s']:.1f}/s "
+              f"of the baseline ({-loss:+.1%})")
+        if loss > args.tolerance:
+            raise SystemExit(f'throughput regression: {loss:.1%} below the baseline, {args.tolerance:.0%} allowed')
+
+
+if __name__ == "__main__":
+    main()
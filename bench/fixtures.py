@@ -0,0 +1,186 @@
+import argparse
+import hashlib
+import json
+import random
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from lib.backends import CARD_ID, get_backend
+from lib.engine import FetchEngine
+from lib.fetcher import Fetcher, PAGE_PARAMS
+from lib.settings import Settings
+
+# a fixture site is a directory of .html pages and index.json:
+#   {"categories": [...], "pages": {"<path>?<sorted query>": "<file>.html"}}
+# the pages are either recorded from zootovary.ru or generated with the markup the extractors expect
+#
+# usage: python -m bench.fixtures generate <directory> [--categories 4] [--pages 6] [--seed 1]
+#        python -m bench.fixtures record <directory> /catalog/<category>/ ... [--config config.json]
+
+INDEX = 'index.json'
+PER_PAGE = PAGE_PARAMS['pc']
+
+
+def page_key(url: str, params: dict = None) -> str:
+    # the same page asked with its parameters in any order has the same key
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query) + [(key, str(value)) for key, value in (params or {}).items()]
+    return f'{parts.path}?{urlencode(sorted(query))}'
+
+
+def load_index(directory: Path) -> dict:
+    return json.loads((directory / INDEX).read_text(encoding='utf-8'))
+
+
+def save_page(directory: Path, pages: dict, key: str, text: str):
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '.html'
+    (directory / name).write_text(text, encoding='utf-8')
+    pages[key] = name
+
+
+def save_index(directory: Path, categories: list[str], pages: dict):
+    (directory / INDEX).write_text(json.dumps({'categories': categories, 'pages': pages}, ensure_ascii=False,
+                                              indent=2), encoding='utf-8')
+
+
+def menu_html(children: list[tuple[str, str, list[tuple[str, str]]]]) -> str:
+    # first level items with their second level menus, the way the left menu of a page is built
+    items = []
+    for href, title, subitems in children:
+        sub = ''.join(f'<li><a class="item-depth-2" href="{sub_href}" title="{sub_title}">{sub_title}</a></li>'
+                      for sub_href, sub_title in subitems)
+        items.append(f'<li><a class="item-depth-1" href="{href}" title="{title}">{title}</a>\n'
+                     f'<ul class="catalog-menu-left-2">{sub}</ul></li>')
+    return '<ul class="catalog-menu-left-1">\n' + '\n'.join(items) + '\n</ul>'
+
+
+def listing_html(link: str, blocks: list[tuple[str, str, str]], pages: int) -> str:
+    items = ''.join(f'<div class="catalog-item"><div class="catalog-content-info">'
+                    f'<a class="name" href="{href}" title="{title}">{title}</a>'
+                    f'<span class="price">{price} р</span></div></div>\n' for href, title, price in blocks)
+    if pages <= 10:
+        links = [f'<a href="{link}?PAGEN_1={page}">{page}</a>' for page in range(1, pages + 1)]
+    else:
+        links = [f'<a href="{link}?PAGEN_1={page}">{page}</a>' for page in range(1, 11)]
+        links.append(f'<a href="{link}?PAGEN_1={pages}">»</a>')
+    return items + f'<div class="navigation">{"".join(links)}</div>'
+
+
+def card_html(title: str, path: list[str], offers: list[tuple], picture: str) -> str:
+    crumbs = '<li><a>Главная</a></li><li>/</li><li><a>Каталог</a></li>' + \
+             ''.join(f'<li>/</li><li><a>{crumb}</a></li>' for crumb in path) + f'<li>/</li><li>{title}</li>'
+    rows = []
+    for article, barcode, min_value, price, promo_price, in_stock in offers:
+        stock = '' if in_stock else '<div class="catalog-item-no-stock">Нет в наличии</div>'
+        rows.append(f'<tr class="b-catalog-element-offer">'
+                    f'<td>\n<span>Артикул</span>\n<span>{article}</span>\n</td>'
+                    f'<td>\n<span>Штрихкод</span>\n<span>{barcode}</span>\n</td>'
+                    f'<td>\n<span>Фасовка</span>\n<span>{min_value}</span>\n</td>'
+                    f'<td>{stock}</td>'
+                    f'<td>\n<span>Цена</span>\n<span></span><span>{price} р</span>\n'
+                    f'<span></span><span>{promo_price + " р" if promo_price else ""}</span></td></tr>')
+    return (f'<html><head><title>{title}</title></head><body><div id="{CARD_ID}">'
+            f'<ul class="breadcrumb-navigation">{crumbs}</ul>'
+            f'<div class="catalog-element-offer-left">\n<div>Бренд: Зоо</div>\n'
+            f'<div>Страна производства: Россия</div>\n</div>'
+            f'<div class="catalog-element-small-picture">\n<a href="{picture}"></a>\n</div>'
+            f'<table class="b-catalog-element-offers-table">{"".join(rows)}</table></div></body></html>')
+
+
+def generate(directory: Path, categories: int = 4, pages: int = 6, seed: int = 1):
+    # categories of the first level with pages * 50 products at most, the last page of each is incomplete
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    index, roots, top = {}, [], []
+    for c in range(1, categories + 1):
+        link = f'/catalog/category-{c}/'
+        title = f'Категория {c}'
+        subitems = [(f'{link}brand-{b}/', f'Бренд {b}') for b in range(1, 4)]
+        menu = menu_html([(href, brand, [(f'{href}line-{k}/', f'Линейка {k}') for k in range(1, 3)])
+                          for href, brand in subitems])
+        roots.append(link)
+        top.append((link, title, subitems))
+        amount = max(1, rng.randint(pages - 1, pages)) * PER_PAGE - rng.randint(1, PER_PAGE - 1)
+        category_pages = -(-amount // PER_PAGE)
+        products = []
+        for p in range(amount):
+            href = f'{link}product-{c}-{p}.html'
+            packing = rng.choice(['400 г', '2 кг', '1 л', '3 шт'])
+            product_title = f'Корм для питомцев {c}-{p}, {packing}'
+            offers = [(f'{c:02}{p:05}{o}', f'46{c:02}{p:07}{o}',
+                       rng.choice(['400 г', '2 кг', '1 л', '3 шт', '100 гр']), str(rng.randint(50, 5000)),
+                       str(rng.randint(40, 4000)) if rng.random() < 0.3 else '', rng.random() < 0.9)
+                      for o in range(rng.randint(1, 3))]
+            products.append((href, product_title, offers[0][3]))
+            save_page(directory, index, page_key(href, PAGE_PARAMS),
+                      card_html(product_title, [title, subitems[p % 3][1]], offers, f'/upload/{c}/{p}.jpg'))
+        for page in range(1, category_pages + 1):
+            listing = listing_html(link, products[(page - 1) * PER_PAGE:page * PER_PAGE], category_pages)
+            text = f'<html><body>{menu}\n{listing}</body></html>'
+            save_page(directory, index, page_key(link, {**PAGE_PARAMS, 'PAGEN_1': page}), text)
+            if page == 1:
+                save_page(directory, index, page_key(link, PAGE_PARAMS), text)
+    save_page(directory, index, page_key('/catalog/', PAGE_PARAMS),
+              f'<html><body>{menu_html(top)}</body></html>')
+    save_index(directory, roots, index)
+    return directory
+
+
+def record(directory: Path, categories: list[str], settings: Settings):
+    # every listing page and every card of the categories, fetched politely with the delays of the config
+    directory.mkdir(parents=True, exist_ok=True)
+    engine = FetchEngine(workers=settings.workers, per_host_limit=settings.per_host_limit,
+                         delay_range=settings.delay_range, rate_limit=settings.rate_limit)
+    fetcher = Fetcher(headers=settings.headers, max_retries=settings.max_retries, pool_size=settings.pool_size,
+                      engine=engine)
+    backend = get_backend('lxml')
+    index = {}
+    try:
+        for link in categories:
+            text = fetcher.get_text(settings.base_url + link, params=PAGE_PARAMS)
+            save_page(directory, index, page_key(link, PAGE_PARAMS), text)
+            hrefs = []
+            page = 1
+            while True:
+                params = {**PAGE_PARAMS, 'PAGEN_1': page}
+                text = fetcher.get_text(settings.base_url + link, params=params)
+                listing = backend.listing(text)
+                new = [href for href, _, _ in listing.blocks if href not in hrefs]
+                if not new:
+                    break
+                save_page(directory, index, page_key(link, params), text)
+                hrefs.extend(new)
+                page += 1
+            for href, text in engine.run(lambda href: fetcher.get_text(settings.base_url + href, params=PAGE_PARAMS),
+                                         hrefs):
+                save_page(directory, index, page_key(href, PAGE_PARAMS), text)
+            print(f'{link}: {page - 1} listing pages, {len(hrefs)} cards')
+    finally:
+        engine.shutdown()
+        fetcher.close()
+    save_index(directory, categories, index)
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='fixture site of the benchmarks')
+    commands = arguments.add_subparsers(dest='command', required=True)
+    generated = commands.add_parser('generate', help='generate a site with the markup of zootovary.ru')
+    generated.add_argument('directory')
+    generated.add_argument('--categories', type=int, default=4)
+    generated.add_argument('--pages', type=int, default=6)
+    generated.add_argument('--seed', type=int, default=1)
+    recorded = commands.add_parser('record', help='record categories of zootovary.ru')
+    recorded.add_argument('directory')
+    recorded.add_argument('categories', nargs='+')
+    recorded.add_argument('--config', default=None)
+    args = arguments.parse_args()
+
+    if args.command == 'generate':
+        generate(Path(args.directory), categories=args.categories, pages=args.pages, seed=args.seed)
+        print(f'{len(load_index(Path(args.directory))["pages"])} pages generated in {args.directory}')
+    else:
+        record(Path(args.directory), args.categories, Settings(config=args.config))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime
+from itertools import count, cycle
+from pathlib import Path
+
+from bs4 import BeautifulSoup, NavigableString
+
+from bench.fixtures import card_html, load_index
+from lib.backends import SoupDom, extract_card, get_backend
+from lib.product import Offer, Product
+
+# peak memory of keeping products of a run, per 10k products, both out of the same card pages:
+#   legacy - the former model: per-instance __dict__ and article, barcode and min value kept as the
+#            NavigableStrings of the parsed page, each of which holds on to the whole tree of its page
+#   slots  - the current Product with __slots__ and offers made of plain strings
+# the cards are generated, or the recorded ones of a fixture site; a real card page is larger than
+# a generated one, and so is what a legacy product keeps of it
+# every model is measured in its own process, so the peak RSS of one does not hide the other
+#
+# usage: python -m bench.memory [--products 2000] [--offers 3] [--site <fixture directory>]
+
+
+class LegacyProduct:
+    def __init__(self, href: str = None, title: str = None, parsed: bool = False):
+        self.href = href
+        self.title = title
+        self.parsed = parsed
+        self.price_datetime = ''
+        self.offers = []
+        self.country = ''
+        self.categories = ''
+        self.pictures = ''
+
+
+class DocumentDom(SoupDom):
+    # the text of a cell the way the former code took it: the NavigableString itself, not a copy of it
+    @staticmethod
+    def text(node, separator: str = '') -> str:
+        return node if isinstance(node, NavigableString) else SoupDom.text(node, separator)
+
+
+LEGACY_DOM = DocumentDom()
+
+
+def generated_pages(offers: int):
+    for i in count():
+        yield card_html(f'Корм для собак, вариант {i}', ['Собаки', 'Корм сухой'],
+                        [(f'{i:06}{j}', f'46000{i:08}{j}', f'{j + 1} кг', f'{100 + j}', '', True)
+                         for j in range(offers)], f'/upload/{i}.jpg')
+
+
+def recorded_pages(site: Path):
+    # card pages of a recorded or generated fixture site, over and over
+    names = [name for key, name in load_index(site)['pages'].items() if key.split('?')[0].endswith('.html')]
+    return cycle([(site / name).read_text(encoding='utf-8') for name in names])
+
+
+def build(model: str, products: int, pages) -> list:
+    result = []
+    backend = get_backend('lxml')
+    for i, page in zip(range(products), pages):
+        href = f'/catalog/tovary-i-korma-dlya-sobak/product-{i}.html'
+        title = f'Корм для собак, вариант {i}'
+        if model == 'legacy':
+            product = LegacyProduct(href, title)
+            card = extract_card(LEGACY_DOM, BeautifulSoup(page, 'lxml'))
+        else:
+            product = Product(href, title)
+            card = backend.card(page)
+        product.price_datetime = datetime.now()
+        for raw in card.offers:
+            product.offers.append(Offer(raw.sku_article, raw.sku_barcode, raw.min_value, raw.min_value, '', '',
+                                        raw.price, raw.promo_price, raw.status))
+        product.country = card.country
+        product.categories = card.categories
+        product.pictures = card.pictures
+        result.append(product)
+    return result
+
+
+def measure(model: str, products: int, pages) -> dict:
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    kept = build(model, products, pages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 10000 / len(kept)
+    # ru_maxrss is in kilobytes on linux
+    return {'model': model, 'traced_peak_mb': peak * scale / 2 ** 20,
+            'rss_growth_mb': (rss_after - rss_before) * scale / 1024}
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='memory of the product model')
+    # every card is parsed under tracemalloc, the figures are scaled to 10k products
+    arguments.add_argument('--products', type=int, default=2000)
+    arguments.add_argument('--offers', type=int, default=3, help='offers of a generated card')
+    arguments.add_argument('--site', default=None, help='fixture directory to take the card pages out of')
+    arguments.add_argument('--model', choices=['legacy', 'slots'], help=argparse.SUPPRESS)
+    args = arguments.parse_args()
+
+    if args.model:
+        pages = recorded_pages(Path(args.site)) if args.site else generated_pages(args.offers)
+        print(json.dumps(measure(args.model, args.products, pages)))
+        return
+    for model in ('legacy', 'slots'):
+        output = subprocess.run([sys.executable, '-m', 'bench.memory', '--model', model,
+                                 '--products', str(args.products), '--offers', str(args.offers)]
+                                + (['--site', args.site] if args.site else []),
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        print(f"{result['model']:>7}: traced peak {result['traced_peak_mb']:8.1f} MB, "
+              f"peak RSS growth {result['rss_growth_mb']:8.1f} MB per 10k products")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import hashlib
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import sleep
+
+from bench.fixtures import load_index, page_key
+
+# local stand-in of zootovary.ru: serves the pages of a fixture site by path and query,
+# every answer is delayed by a random latency and a share of them fails with 503 or 429
+#
+# usage: python -m bench.mock_site <fixtures directory> [--port 8000] [--latency-ms 20 80] [--error-rate 0.01]
+
+
+class MockSite:
+    def __init__(self, directory: Path, latency_ms: tuple[float, float] = (0, 0), error_rate: float = 0.0,
+                 port: int = 0, seed: int = 1):
+        index = load_index(directory)
+        self.categories: list[str] = index['categories']
+        # pages are read once, the site itself must cost next to nothing next to the crawler
+        self.pages: dict[str, bytes] = {key: (directory / name).read_bytes() for key, name in index['pages'].items()}
+        self.etags = {key: hashlib.sha1(body).hexdigest() for key, body in self.pages.items()}
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.misses = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+        self.server.daemon_threads = True
+        self.thread: threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def draw(self) -> tuple[float, int]:
+        # latency of the answer and the error status it fails with, 0 if it does not
+        with self.lock:
+            self.requests += 1
+            latency = self.random.uniform(*self.latency_ms) / 1000
+            if self.random.random() >= self.error_rate:
+                return latency, 0
+            self.errors += 1
+            return latency, 429 if self.random.random() < 0.5 else 503
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body go out in separate writes, with Nagle on each keep-alive answer waits for an ack
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                latency, error = site.draw()
+                sleep(latency)
+                key = page_key(self.path)
+                if error:
+                    self.answer(error, b'')
+                elif key not in site.pages:
+                    with site.lock:
+                        site.misses += 1
+                    self.answer(404, b'<html><body></body></html>')
+                elif self.headers.get('If-None-Match') == site.etags[key]:
+                    self.answer(304, b'', etag=site.etags[key])
+                else:
+                    self.answer(200, site.pages[key], etag=site.etags[key])
+
+            def answer(self, status: int, body: bytes, etag: str = None):
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                if status in (429, 503):
+                    self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'MockSite':
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mock-site', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors, 'misses': self.misses}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='local stand-in of zootovary.ru')
+    arguments.add_argument('fixtures', help='directory of a fixture site')
+    arguments.add_argument('--port', type=int, default=8000)
+    arguments.add_argument('--latency-ms', type=float, nargs=2, default=(0, 0))
+    arguments.add_argument('--error-rate', type=float, default=0.0)
+    args = arguments.parse_args()
+
+    site = MockSite(Path(args.fixtures), latency_ms=tuple(args.latency_ms), error_rate=args.error_rate,
+                    port=args.port)
+    print(f'serving {len(site.pages)} pages of {len(site.categories)} categories at {site.url}')
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import random
+from datetime import datetime
+from time import perf_counter
+
+from lib.normalize import arrow, measure, normalize_offers, number
+from lib.writer import GOODS_HEADERS
+
+# normalization of offers one row at a time in python against the batch pass on arrow columns
+# the same quantities, units and prices per unit must come out of both
+#
+# usage: python -m bench.normalize [--offers 100000]
+
+
+def make_rows(offers: int) -> list[tuple]:
+    rng = random.Random(1)
+    rows = []
+    for i in range(offers):
+        text = rng.choice(['400 г', '2 кг', '0,5 л', '250 мл', '3 шт', '100 гр', 'гель', ''])
+        unit = measure(text)
+        columns = ['' for _ in GOODS_HEADERS]
+        columns[:4] = ['2024-01-31 10:00:00.000001', f'{rng.randint(50, 5000)}',
+                       f'{rng.randint(40, 4000)}' if rng.random() < 0.3 else '', '1']
+        columns[9 + ['kg', 'l', 'pcs'].index(unit[1]) if unit else 9] = text
+        rows.append(tuple(columns))
+    return rows
+
+
+def per_row(rows: list[tuple]) -> list[tuple]:
+    # what the same columns cost one offer at a time
+    result = []
+    for row in rows:
+        moment, price, promo, status = datetime.fromisoformat(row[0]), number(row[1]), number(row[2]), int(row[3])
+        found = measure(row[9] or row[10] or row[11])
+        quantity, unit = found if found else (None, None)
+        price = promo if promo is not None else price
+        result.append((moment, status, quantity, unit, price / quantity if price is not None and quantity else None))
+    return result
+
+
+def batched(rows: list[tuple]) -> dict:
+    pyarrow, _ = arrow()
+    columns = {name: pyarrow.array([row[i] for row in rows], pyarrow.string()) for i, name in enumerate(GOODS_HEADERS)}
+    return normalize_offers(columns)
+
+
+def same(per_row_result: list[tuple], batched_result: dict) -> list[int]:
+    batched_rows = zip(batched_result['unit'].to_pylist(), batched_result['price_per_unit'].to_pylist())
+    return [i for i, (theirs, (unit, per_unit)) in enumerate(zip(per_row_result, batched_rows))
+            if unit != theirs[3] or (per_unit is None) != (theirs[4] is None)
+            or (per_unit is not None and abs(per_unit - theirs[4]) > 1e-6 * abs(theirs[4]))]
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='normalization of offers benchmark')
+    arguments.add_argument('--offers', type=int, default=100000)
+    args = arguments.parse_args()
+    # without pyarrow the batch pass cannot run, which is said before anything is measured
+    arrow()
+
+    rows = make_rows(args.offers)
+    results = {}
+    for name, normalize in (('per row', per_row), ('batched', batched)):
+        started = perf_counter()
+        results[name] = normalize(rows)
+        print(f'{name:>8}: {(perf_counter() - started) * 1000:8.1f} ms for {len(rows)} offers')
+    differences = same(results['per row'], results['batched'])
+    if differences:
+        raise SystemExit(f'batched normalization differs on {len(differences)} offers, first: {differences[:5]}')
+    print('both produce the same quantities, units and prices per unit')
+
+
+if __name__ == "__main__":
+    main()
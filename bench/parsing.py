@@ -0,0 +1,44 @@
+import argparse
+from pathlib import Path
+from time import perf_counter
+
+from lib.backends import BACKENDS
+
+# every saved page is parsed as a card and as a listing by each backend:
+# the extracted rows must be identical, the timings show what each backend costs
+#
+# usage: python -m bench.parsing <directory with saved .html pages> [--repeat 5]
+
+
+def measure(backend, pages: list[str], repeat: int):
+    started = perf_counter()
+    for _ in range(repeat):
+        results = [(backend.card(text), backend.listing(text)) for text in pages]
+    return (perf_counter() - started) / repeat, results
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='parser backends benchmark')
+    arguments.add_argument('pages', help='directory with saved card and listing pages')
+    arguments.add_argument('--repeat', type=int, default=5)
+    args = arguments.parse_args()
+
+    pages = [path.read_text(encoding='utf-8') for path in sorted(Path(args.pages).glob('*.html'))]
+    if not pages:
+        raise SystemExit(f'no .html pages found in {args.pages}')
+    reference_name, reference = None, None
+    for name, backend in BACKENDS.items():
+        elapsed, results = measure(backend, pages, max(1, args.repeat))
+        print(f'{name:>10}: {elapsed * 1000:9.1f} ms for {len(pages)} pages, '
+              f'{elapsed * 1000 / len(pages):7.2f} ms per page')
+        if reference is None:
+            reference_name, reference = name, results
+            continue
+        differences = [index for index, (ours, theirs) in enumerate(zip(results, reference)) if ours != theirs]
+        if differences:
+            raise SystemExit(f'{name} rows differ from {reference_name} on pages: {differences}')
+    print('all backends produce identical rows')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+# main.py start to finish for the quick commands the scheduler and the analysts launch over and over:
+# history queries against a store and an export of a journal, both empty; these must not load the crawl modules.
+# crawl and refresh-tree are left out, their time is the network
+#
+# usage: python -m bench.startup [--config config.json] [--repeat 10] [--limit-ms 100]
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ('requests', 'urllib3', 'bs4', 'lxml', 'loguru', 'pyarrow', 'zstandard', 'tracemalloc', 'lib.parser')
+# main.py as `python main.py ...` runs it, then the heavy modules it has loaded as the last line of stderr
+PROBE = ('import runpy, sys\n'
+         f'sys.argv = [{str(ROOT / "main.py")!r}] + sys.argv[1:]\n'
+         'try:\n'
+         '    runpy.run_path(sys.argv[0], run_name="__main__")\n'
+         'finally:\n'
+         f'    print("loaded:", ",".join(name for name in {HEAVY!r} if name in sys.modules), file=sys.stderr)')
+
+
+def commands(config: str, workdir: Path) -> dict[str, list[str]]:
+    return {'history sku': ['history', 'sku', '01000010', '--config', config],
+            'history promos': ['history', 'promos', '2024-01-01', '--config', config],
+            'history index': ['history', 'index', '/catalog/', '2024-01-01', '2024-01-31', '--config', config],
+            'export': ['export', config, '--formats', 'csv', '--output', str(workdir / 'export')]}
+
+
+def bench_config(config: str, workdir: Path) -> str:
+    settings = json.loads(Path(config).read_text(encoding='utf-8'))
+    settings.update({'output_directory': str(workdir / 'out'), 'journal_file': str(workdir / 'out' / 'journal.sqlite'),
+                     'output': {**settings['output'], 'history_file': str(workdir / 'out' / 'history.sqlite')}})
+    path = workdir / 'config.json'
+    path.write_text(json.dumps(settings, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def start(arguments: list[str]) -> tuple[float, str]:
+    started = perf_counter()
+    done = subprocess.run([sys.executable, *arguments], cwd=ROOT, capture_output=True, text=True)
+    seconds = perf_counter() - started
+    if done.returncode != 0:
+        raise SystemExit(f'{" ".join(arguments[2:])} failed: {done.stderr}')
+    lines = done.stderr.strip().splitlines()
+    return seconds, lines[-1].removeprefix('loaded:').strip() if lines else ''
+
+
+def measure(arguments: list[str], repeat: int) -> tuple[float, str]:
+    start(arguments)  # the first start warms the file cache and the bytecode, and creates the stores
+    runs = [start(arguments) for _ in range(repeat)]
+    return statistics.median(seconds for seconds, _ in runs) * 1000, runs[-1][1]
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='main.py startup benchmark')
+    arguments.add_argument('--config', default=str(ROOT / 'config.json'))
+    arguments.add_argument('--repeat', type=int, default=10)
+    arguments.add_argument('--limit-ms', type=float, default=100, help='allowed time of a command')
+    args = arguments.parse_args()
+
+    interpreter, _ = measure(['-c', 'pass'], args.repeat)
+    print(f'{"python":>15}: {interpreter:6.1f} ms')
+    failures = []
+    with tempfile.TemporaryDirectory(prefix='zoo-startup-') as tmp:
+        config = bench_config(args.config, Path(tmp))
+        for name, command in commands(config, Path(tmp)).items():
+            ms, heavy = measure(['-c', PROBE, *command], args.repeat)
+            print(f'{name:>15}: {ms:6.1f} ms, {ms - interpreter:6.1f} ms over the interpreter'
+                  + (f' | loaded: {heavy}' if heavy else ''))
+            if ms > args.limit_ms:
+                failures.append(f'{name} takes {ms:.0f} ms, {args.limit_ms:.0f} ms allowed')
+            if heavy:
+                failures.append(f'{name} loads {heavy}')
+    if failures:
+        raise SystemExit('startup regression: ' + '; '.join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import hashlib
+from collections import namedtuple
+from time import perf_counter
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+from lxml import html
+
+ZOO_URL = 'https://zootovary.ru'
+CARD_ID = 'comp_d68034d8231659a2cf5539cfbbbd3945'
+
+# everything we take out of the pages as plain strings and ints, no parsed tree is kept behind them
+RawOffer = namedtuple('RawOffer', 'sku_article, sku_barcode, min_value, price, promo_price, status')
+Card = namedtuple('Card', 'offers, country, categories, pictures')
+Listing = namedtuple('Listing', 'count, navigation, blocks')
+
+
+class SoupDom:
+    # the few tree operations the extractors need, on top of BeautifulSoup
+    @staticmethod
+    def is_tag(node) -> bool:
+        return isinstance(node, Tag)
+
+    @staticmethod
+    def contents(node) -> list:
+        return node.contents
+
+    @staticmethod
+    def text(node, separator: str = '') -> str:
+        return node.get_text(separator) if isinstance(node, Tag) else str(node)
+
+    @staticmethod
+    def attrs(node) -> dict:
+        return node.attrs
+
+    @staticmethod
+    def find(node, tag: str, class_: str = None, id_: str = None):
+        if id_ is not None:
+            return node.find(tag, {'id': id_})
+        return node.find(tag, class_)
+
+    @staticmethod
+    def find_all(node, tag: str, class_: str):
+        return node.find_all(tag, class_)
+
+    @staticmethod
+    def parent(node, tag: str, class_: str):
+        return node.find_parent(tag, class_)
+
+
+class LxmlDom:
+    # the same operations on lxml.html elements; contents() rebuilds the mixed list of strings and
+    # elements BeautifulSoup would give, so the positional walking of the extractors stays the same
+    @staticmethod
+    def is_tag(node) -> bool:
+        return not isinstance(node, str) and isinstance(node.tag, str)
+
+    @staticmethod
+    def contents(node) -> list:
+        result = [node.text] if node.text else []
+        for child in node:
+            result.append(child)
+            if child.tail:
+                result.append(child.tail)
+        return result
+
+    @staticmethod
+    def text(node, separator: str = '') -> str:
+        if isinstance(node, str):
+            return node
+        return separator.join(node.xpath('.//text()')) if isinstance(node.tag, str) else ''
+
+    @staticmethod
+    def attrs(node) -> dict:
+        return node.attrib
+
+    @staticmethod
+    def class_test(class_: str) -> str:
+        return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_} ')"
+
+    def find(self, node, tag: str, class_: str = None, id_: str = None):
+        found = self.find_all(node, tag, class_, id_)
+        return found[0] if found else None
+
+    def find_all(self, node, tag: str, class_: str = None, id_: str = None):
+        test = f"[@id='{id_}']" if id_ is not None else f'[{self.class_test(class_)}]' if class_ else ''
+        return node.xpath(f'.//{tag}{test}')
+
+    def parent(self, node, tag: str, class_: str):
+        found = node.xpath(f'ancestor::{tag}[{self.class_test(class_)}][1]')
+        return found[0] if found else None
+
+
+def children(dom, node) -> list:
+    return [item for item in dom.contents(node) if dom.is_tag(item)] if node is not None else []
+
+
+def first_text(dom, node, j: int) -> str:
+    # text of the first child of the j-th child of the node, the way the cells of the offers table are built
+    contents = dom.contents(node)
+    if len(contents) > j and dom.is_tag(contents[j]) and dom.contents(contents[j]):
+        return dom.text(dom.contents(contents[j])[0])
+    return ""
+
+
+def get_status(dom, p_wrapper) -> int:
+    return 1 if dom.find(p_wrapper, 'div', 'catalog-item-no-stock') is None else 0
+
+
+def get_country(dom, c_wrapper) -> str:
+    contents = dom.contents(c_wrapper) if c_wrapper is not None else []
+    if len(contents) > 3 and dom.is_tag(contents[3]) and len(dom.contents(contents[3])) > 0:
+        parts = dom.text(dom.contents(contents[3])[0]).split(':')
+        return parts[1].strip() if len(parts) > 1 else ""
+    return ""
+
+
+def get_categories(dom, category_wrapper) -> str:
+    contents = dom.contents(category_wrapper) if category_wrapper is not None else []
+    categs = []
+    for i in range(4, len(contents) - 2, 2):
+        if dom.is_tag(contents[i]) and dom.contents(contents[i]):
+            categs.append(dom.text(dom.contents(contents[i])[0]))
+    return '|'.join(categs)
+
+
+def get_pictures(dom, picture_wrapper) -> str:
+    links = []
+    for picture in picture_wrapper:
+        contents = dom.contents(picture)
+        if len(contents) > 1 and dom.is_tag(contents[1]) and 'href' in dom.attrs(contents[1]):
+            links.append(ZOO_URL + dom.attrs(contents[1])['href'])
+    return ', '.join(links)
+
+
+def get_offers(dom, offers_table) -> list[RawOffer]:
+    offers = []
+    # оказывается в карточке есть несколько предложений » offers table
+    for offer in children(dom, offers_table):
+        items = children(dom, offer)
+        if len(items) < 5:
+            continue
+        offers.append(RawOffer(sku_article=first_text(dom, items[0], 3), sku_barcode=first_text(dom, items[1], 3),
+                               min_value=first_text(dom, items[2], 3),
+                               price=first_text(dom, items[4], 4).strip(' р'),
+                               promo_price=first_text(dom, items[4], 7).strip(' р'),
+                               status=get_status(dom, offer)))
+    return offers
+
+
+def extract_card(dom, root) -> Card | None:
+    element = dom.find(root, 'div', id_=CARD_ID)
+    if element is None:
+        return None
+    return Card(offers=get_offers(dom, dom.find(element, 'table', 'b-catalog-element-offers-table')),
+                country=get_country(dom, dom.find(element, 'div', 'catalog-element-offer-left')),
+                categories=get_categories(dom, dom.find(element, 'ul', 'breadcrumb-navigation')),
+                pictures=get_pictures(dom, dom.find_all(element, 'div', 'catalog-element-small-picture')))
+
+
+def listing_fingerprint(dom, item) -> str:
+    # whatever the listing shows about a product (title, price, stock) is inside of its catalog-item block
+    block = dom.parent(item, 'div', 'catalog-item')
+    text = ' '.join(dom.text(block if block is not None else item, ' ').split())
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def extract_listing(dom, root) -> Listing:
+    navigation = dom.find(root, 'div', 'navigation')
+    blocks = []
+    for item in dom.find_all(root, 'div', 'catalog-content-info'):
+        link = dom.find(item, 'a', 'name')
+        blocks.append((dom.attrs(link)['href'], dom.attrs(link)['title'], listing_fingerprint(dom, item)))
+    return Listing(count=len(dom.find_all(root, 'div', 'catalog-item')),
+                   navigation=[(dom.text(link), dom.attrs(link).get('href', '')) for link in children(dom, navigation)],
+                   blocks=blocks)
+
+
+class SoupBackend:
+    # the whole document goes through BeautifulSoup
+    name = 'soup'
+    dom = SoupDom()
+
+    def soup(self, text: str, strainer: SoupStrainer = None) -> BeautifulSoup:
+        return BeautifulSoup(text, 'lxml')
+
+    def card(self, text: str) -> Card | None:
+        return extract_card(self.dom, self.soup(text, CARD_STRAINER))
+
+    def listing(self, text: str) -> Listing:
+        return extract_listing(self.dom, self.soup(text, LISTING_STRAINER))
+
+
+class StrainerBackend(SoupBackend):
+    # BeautifulSoup builds only the regions we take data out of, header, footer and scripts are skipped
+    name = 'strainer'
+
+    def soup(self, text: str, strainer: SoupStrainer = None) -> BeautifulSoup:
+        return BeautifulSoup(text, 'lxml', parse_only=strainer)
+
+
+class LxmlBackend:
+    # lxml.html tree with XPath lookups, no BeautifulSoup objects at all
+    name = 'lxml'
+    dom = LxmlDom()
+
+    @staticmethod
+    def root(text: str):
+        return html.document_fromstring(text if text.strip() else '<html></html>')
+
+    def card(self, text: str) -> Card | None:
+        return extract_card(self.dom, self.root(text))
+
+    def listing(self, text: str) -> Listing:
+        return extract_listing(self.dom, self.root(text))
+
+
+CARD_STRAINER = SoupStrainer('div', id=CARD_ID)
+LISTING_STRAINER = SoupStrainer('div', class_=['catalog-item', 'catalog-content-info', 'navigation'])
+BACKENDS = {backend.name: backend for backend in (SoupBackend(), StrainerBackend(), LxmlBackend())}
+
+
+def get_backend(name: str = 'soup'):
+    if name not in BACKENDS:
+        raise ValueError(f'unknown parser backend {name}, expected one of: {", ".join(BACKENDS)}')
+    return BACKENDS[name]
+
+
+def extract_card_page(backend_name: str, text: str) -> tuple[Card | None, float]:
+    # entry point of the parsing processes: page text in, plain Card record and seconds it took out
+    started = perf_counter()
+    card = get_backend(backend_name).card(text)
+    return card, perf_counter() - started
@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+import zlib
+from pathlib import Path
+from time import time
+from urllib.parse import urlencode
+
+# page kinds with their own time to live
+MENU = 'menu'
+LISTING = 'listing'
+CARD = 'card'
+
+
+class CacheEntry:
+    __slots__ = ('text', 'etag', 'last_modified', 'stored_at')
+
+    def __init__(self, text: str, etag: str, last_modified: str, stored_at: float):
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def fresh(self, ttl_h: float) -> bool:
+        return time() - self.stored_at < ttl_h * 3600
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PageCache:
+    # zlib-compressed pages in sqlite keyed by url and params, evicted least recently used first
+    # when the cache grows over max_size_mb
+    def __init__(self, path: Path, max_size_mb: float = 512, ttl_h: dict = None, offline: bool = False):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.ttl_h = ttl_h if ttl_h else {}
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, kind TEXT, etag TEXT, '
+                                'last_modified TEXT, stored_at REAL, accessed_at REAL, size INTEGER, body BLOB)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)')
+        self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    @staticmethod
+    def key(url: str, params: dict = None) -> str:
+        return f'{url}?{urlencode(sorted(params.items()))}' if params else url
+
+    def ttl(self, kind: str) -> float:
+        return self.ttl_h.get(kind, 0)
+
+    def lookup(self, key: str) -> CacheEntry | None:
+        with self.lock:
+            row = self.connection.execute('SELECT body, etag, last_modified, stored_at FROM pages WHERE key = ?',
+                                          (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('UPDATE pages SET accessed_at = ? WHERE key = ?', (time(), key))
+            self.connection.commit()
+        body, etag, last_modified, stored_at = row
+        return CacheEntry(zlib.decompress(body).decode('utf-8'), etag, last_modified, stored_at)
+
+    def store(self, key: str, kind: str, text: str, etag: str = None, last_modified: str = None):
+        body = zlib.compress(text.encode('utf-8'), 6)
+        now = time()
+        with self.lock:
+            row = self.connection.execute('SELECT size FROM pages WHERE key = ?', (key,)).fetchone()
+            self.size -= row[0] if row else 0
+            self.connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (key, kind, etag, last_modified, now, now, len(body), body))
+            self.size += len(body)
+            if self.size > self.max_size:
+                self.evict()
+            self.connection.commit()
+
+    def revalidated(self, key: str):
+        # the site said 304, the stored page is fresh again
+        now = time()
+        with self.lock:
+            self.connection.execute('UPDATE pages SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+            self.connection.commit()
+
+    def evict(self):
+        # drops least recently used pages until the cache takes 90% of its limit
+        target = int(self.max_size * 0.9)
+        rows = self.connection.execute('SELECT key, size FROM pages ORDER BY accessed_at').fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self.connection.executemany('DELETE FROM pages WHERE key = ?', evicted)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -1,7 +1,7 @@
-import requests
-from bs4 import BeautifulSoup
 from loguru import logger
 
+from lib.cache import MENU
+from lib.fetcher import Fetcher, PAGE_PARAMS
 from lib.helper import tags
 
 STAGES = {
@@ -21,17 +21,20 @@ STAGES = {
 }
 
 
-def get_page_with_url(url: str):
-    # randomized delay according to settings
-    params = {'pc': 50, 'v': 'filling'}
-    # sleep(uniform(self.delay_range[0], self.delay_range[1]))
-    result = requests.get(url, params=params)
-    return BeautifulSoup(result.text, 'lxml')
-
-
 class Category:
+    __slots__ = ('fetcher', 'registry', 'lazy', 'expanded', 'page_loaded', 'base_url', 'stage', 'title', 'url', 'link',
+                 'code', 'parent_id', 'child_nodes', 'soup')
+
     def __init__(self, stage: int = 0, title: str = None, url: str = None, base_url: str = None, link: str = None,
-                 code: int = None, parent_id: int = None, soup: str = None):
+                 code: int = None, parent_id: int = None, soup: str = None, fetcher: Fetcher = None,
+                 lazy: bool = False, registry=None):
+        self.fetcher = fetcher
+        # stable ids out of the registry, positional ones without it
+        self.registry = registry
+        # a lazy node looks down for its children only when someone asks for them
+        self.lazy = lazy
+        self.expanded = False
+        self.page_loaded = False
         self.base_url = base_url
         self.stage = stage
         self.title = title
@@ -39,11 +42,12 @@ class Category:
         self.link = link
         self.code = code
         self.parent_id = parent_id
-        self.children: dict[str: Category] = {}
-        self.soup: str = soup
+        self.child_nodes: dict[str: Category] = {}
+        # the page or the menu item the children are taken out of, released as soon as they have been
+        self.soup = soup
         #
-        if base_url:
-            self.add_children()
+        if base_url and not lazy:
+            self.expand()
 
     def __str__(self):
         return f"{STAGES[self.stage]['indent']}[{self.stage}] {self.title} | id:{self.code} | parent_id:{self.parent_id} | link: {self.link}"
@@ -72,6 +76,29 @@ class Category:
             _child.list_of_children(list_=list_)
         return list_
 
+    @property
+    def children(self) -> dict:
+        if self.base_url:
+            self.expand()
+        return self.child_nodes
+
+    def expand(self):
+        if self.expanded:
+            return
+        self.expanded = True
+        self.add_children()
+
+    def needs_page(self) -> bool:
+        # top and first level categories take their children out of their own page,
+        # the deeper ones out of the menu of their parent
+        if self.page_loaded or STAGES[self.stage]['stop']:
+            return False
+        return self.stage in [0, 1] or self.soup is None
+
+    def load_page(self):
+        self.soup = self.fetcher.get_soup(self.base_url + self.link, params=PAGE_PARAMS, kind=MENU)
+        self.page_loaded = True
+
     def add_children(self):
         # now we'll look down to the category link in order to create its tree
         # each category consists of 4 elements: top-category, category, brand, sub-category
@@ -82,9 +109,10 @@ class Category:
         # tovary-i-korma-dlya-sobak/korm-sukhoy/advance_1/shchenki_1/ - sub-category
         if STAGES[self.stage]['stop']:
             return
-        if self.stage in [0, 1] or self.soup is None:
-            self.soup = get_page_with_url(self.base_url + self.link)
+        if self.needs_page():
+            self.load_page()
         catalog = self.soup.find(STAGES[self.stage]['catalog']['tag'], STAGES[self.stage]['catalog']['class'])
+        self.soup = None
         index = 0
         if not catalog:
             return
@@ -92,17 +120,21 @@ class Category:
             item = tag.find(STAGES[self.stage]['item']['tag'], STAGES[self.stage]['item']['class'])
             # print(item['title'] + ' | ' + item['href'])
             index += 1
-            item_code = self.code + index * STAGES[self.stage]['multiplier']
-            self.children[item['href']] = Category(stage=self.stage + 1, title=item['title'],
-                                                   url=self.base_url + item['href'],
-                                                   base_url=self.base_url, link=item['href'], code=item_code,
-                                                   parent_id=self.code, soup=tag)
+            if self.registry is not None:
+                item_code = self.registry.child_code(self.link, self.code, self.stage, item['href'])
+            else:
+                item_code = self.code + index * STAGES[self.stage]['multiplier']
+            self.child_nodes[item['href']] = Category(stage=self.stage + 1, title=item['title'],
+                                                      url=self.base_url + item['href'],
+                                                      base_url=self.base_url, link=item['href'], code=item_code,
+                                                      parent_id=self.code, soup=tag, fetcher=self.fetcher,
+                                                      lazy=self.lazy, registry=self.registry)
 
 
 if __name__ == "__main__":
     ZOO_URL = 'https://zootovary.ru'
     CATALOG = '/catalog/'
-    top = Category(url=ZOO_URL + CATALOG, base_url=ZOO_URL, link=CATALOG, code=0, stage=0)
+    top = Category(url=ZOO_URL + CATALOG, base_url=ZOO_URL, link=CATALOG, code=0, stage=0, fetcher=Fetcher())
     # top.print_with_children()
     temp = top.list_of_children()
     print(f'total amount of categories are: {len(temp)}')
@@ -0,0 +1,275 @@
+import argparse
+import sys
+from pathlib import Path
+
+from lib.settings import DEFAULT_CONFIG, Settings, load_settings
+
+# the command line of main.py, which starts for every shard, resume and tree refresh the scheduler launches,
+# so only argparse and the config are loaded up front; network, parsing, outputs and loguru are imported
+# by the command that needs them
+COMMANDS = ('crawl', 'refresh-tree', 'export', 'history', 'bench')
+BENCHMARKS = ('crawl', 'parsing', 'memory', 'normalize', 'startup')
+# lib.shards.CATEGORY and LINKS, not imported here for the same reason
+SHARD_MODES = ('category', 'links')
+
+
+def set_logging_file(settings: Settings, suffix: str = ''):
+    from lib.logs import set_logging
+
+    provided = settings.provided
+    set_logging(logs_dir=settings.logs_dir if provided else 'logs', suffix=suffix,
+                config=settings.logging if provided else None)
+
+
+def require_config(settings: Settings, config: str, command: str):
+    # a plain crawl runs on the defaults of the parser without a config, everything else needs its sections
+    if not settings.provided:
+        raise SystemExit(f'{command} needs a config, {config or DEFAULT_CONFIG} has not been found')
+
+
+def parse_args(argv: list[str] = None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # `main.py [config] [--resume]` of the earlier versions is a crawl
+    if not argv or argv[0] not in COMMANDS + ('-h', '--help'):
+        argv.insert(0, 'crawl')
+    arguments = argparse.ArgumentParser(description='zootovary.ru parser')
+    commands = arguments.add_subparsers(dest='command', required=True)
+    config = argparse.ArgumentParser(add_help=False)
+    config.add_argument('config', nargs='?', default=None, help='path to config.json')
+
+    crawled = commands.add_parser('crawl', parents=[config], help='crawl the configured categories')
+    crawled.add_argument('--resume', action='store_true', help='continue the previous run out of its journal')
+    crawled.add_argument('--offline', action='store_true', help='replay pages out of the cache only')
+    crawled.add_argument('--trace-memory', action='store_true', help='trace memory allocations of the run')
+    # sharded crawl: one coordinator fills the queue, any number of workers on any boxes take shards out of it,
+    # the merge puts their outputs together
+    crawled.add_argument('--coordinator', choices=SHARD_MODES, default=None,
+                         help='split the crawl into shards by category or by product links')
+    crawled.add_argument('--worker', action='store_true', help='crawl shards out of the queue until it is empty')
+    crawled.add_argument('--processes', type=int, default=1, help='worker processes to start on this box')
+    crawled.add_argument('--merge', action='store_true', help='merge outputs of the done shards')
+
+    refreshed = commands.add_parser('refresh-tree', parents=[config],
+                                    help='walk the category trees again, write the tree snapshot and categories.csv')
+    refreshed.add_argument('--offline', action='store_true', help='replay pages out of the cache only')
+
+    exported = commands.add_parser('export', parents=[config],
+                                   help='write the goods of the last run out of its journal in other formats')
+    exported.add_argument('--formats', nargs='+', required=True,
+                          help='csv, csv.gz, csv.zst, parquet, arrow or history')
+    exported.add_argument('--output', default=None, help='directory to write to, the output directory by default')
+
+    # the price history of the runs, the store is the history_file of the output section of the config
+    history = commands.add_parser('history', help='price history of the offers over the runs')
+    queries = history.add_subparsers(dest='query', required=True)
+    store = argparse.ArgumentParser(add_help=False)
+    store.add_argument('--config', default=None, help='path to config.json')
+    sku = queries.add_parser('sku', parents=[store], help='every price change of an article or a barcode')
+    sku.add_argument('sku', help='article or barcode')
+    promos = queries.add_parser('promos', parents=[store], help='promo prices started, changed or ended since a day')
+    promos.add_argument('since', help='day or time, 2024-01-31 or 2024-01-31 10:00')
+    promos.add_argument('--category', default='', help='a category link, with its subcategories')
+    index = queries.add_parser('index', parents=[store], help='price index of a category against a base day')
+    index.add_argument('category', help='a category link, with its subcategories')
+    index.add_argument('base', help='base day, 2024-01-31')
+    index.add_argument('days', nargs='+', help='days to compare with the base day')
+    ingest = queries.add_parser('ingest', parents=[store], help='load goods.csv files of earlier runs, oldest first')
+    ingest.add_argument('files', nargs='+', help='goods.csv files')
+    ingest.add_argument('--category', default='', help='category link the goods of the files belong to')
+
+    benched = commands.add_parser('bench', help='run one of the benchmarks, the rest of the arguments are its own')
+    benched.add_argument('benchmark', choices=BENCHMARKS)
+    benched.add_argument('arguments', nargs=argparse.REMAINDER)
+    return arguments.parse_args(argv)
+
+
+def crawl(settings: Settings, resume: bool, offline: bool, trace_memory: bool):
+    from lib.parser import Parser
+
+    parser = Parser(settings=settings, resume=resume, offline=offline, trace_memory=trace_memory)
+    parser.setup_session()
+    try:
+        parser.work()
+        parser.csv_write()
+    finally:
+        parser.metrics.write(parser.out_dir / parser.metrics_config['summary_file'])
+        parser.close()
+
+
+def coordinate(settings: Settings, mode: str, offline: bool):
+    from lib.parser import Parser
+    from lib.shards import WorkQueue, coordinator_settings, split
+
+    parser = Parser(settings=coordinator_settings(settings), offline=offline)
+    parser.setup_session()
+    queue = WorkQueue(Path(settings.shards['queue_file']))
+    try:
+        split(parser, queue, mode=mode, shard_size=settings.shards['shard_size'])
+    finally:
+        parser.close()
+        queue.close()
+
+
+def work_shards(settings: Settings, offline: bool, suffix: str = ''):
+    # the settings checked by the starting process are handed to the spawned ones as they are
+    from lib.shards import WorkQueue, run_worker
+
+    if suffix:
+        set_logging_file(settings, suffix=suffix)
+    queue = WorkQueue(Path(settings.shards['queue_file']))
+    try:
+        run_worker(settings, queue, lease_s=settings.shards['lease_s'], max_attempts=settings.shards['max_attempts'],
+                   offline=offline)
+    finally:
+        queue.close()
+
+
+def merge_shards(settings: Settings):
+    from lib.shards import WorkQueue, merge
+
+    queue = WorkQueue(Path(settings.shards['queue_file']))
+    try:
+        merge(queue, Path(settings.output_directory), settings.output['formats'],
+              batch_rows=settings.output['batch_rows'], history_file=Path(settings.output['history_file']))
+    finally:
+        queue.close()
+
+
+def start_workers(settings: Settings, offline: bool, processes: int):
+    # every process takes shards on its own, they only meet in the queue
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=work_shards, args=(settings, offline, f'-worker-{i}'), name=f'worker-{i}')
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def run_crawl(args, settings: Settings):
+    from time import sleep
+
+    from loguru import logger
+
+    if args.coordinator or args.worker or args.merge:
+        if args.coordinator:
+            coordinate(settings, mode=args.coordinator, offline=args.offline)
+        if args.worker and args.processes > 1:
+            start_workers(settings, offline=args.offline, processes=args.processes)
+        elif args.worker:
+            work_shards(settings, offline=args.offline)
+        if args.merge:
+            merge_shards(settings)
+        return
+    # the run is restarted out of its journal after a failure, restart_count times at most
+    restart = settings.restart if settings.provided else {'restart_count': 0, 'interval_m': 0}
+    resume = args.resume
+    for attempt in range(restart['restart_count'] + 1):
+        try:
+            crawl(settings=settings, resume=resume, offline=args.offline, trace_memory=args.trace_memory)
+            break
+        except Exception as e:
+            if attempt == restart['restart_count']:
+                raise
+            logger.exception(f'Run failed: {e}. Restarting out of the checkpoint in {restart["interval_m"]} min '
+                             f'({attempt + 1}/{restart["restart_count"]})')
+            sleep(restart['interval_m'] * 60)
+            resume = True
+
+
+def refresh_tree(args, settings: Settings):
+    # the trees are walked whatever the age of their snapshot; the journal of the last run is kept
+    from lib.parser import Parser
+
+    settings = settings.copy(tree={**settings.tree, 'refresh_h': 0},
+                             incremental={**settings.incremental, 'enabled': False})
+    parser = Parser(settings=settings, resume=True, offline=args.offline)
+    parser.setup_session()
+    try:
+        for url in parser.required_categories_list:
+            parser.parse_all_categories(url)
+        parser.csv_write()
+    finally:
+        parser.close()
+
+
+def export(args, settings: Settings):
+    # goods of the last run are in its journal with their categories, which the partitioned formats need;
+    # a quick command like history, so it reports to stderr instead of setting up the run logs
+    from lib.journal import Journal
+    from lib.sinks import open_sinks
+
+    out_dir = Path(args.output or settings.output_directory)
+    journal = Journal(Path(settings.journal_file))
+    products = 0
+    try:
+        with open_sinks(out_dir, args.formats, batch_rows=settings.output['batch_rows'],
+                        history_file=Path(settings.output['history_file'])) as sinks:
+            for href, category, rows in journal.done_products():
+                sinks.write_rows(rows, category=category)
+                products += 1
+            rows = sinks.rows
+    finally:
+        journal.close()
+    print(f'{products} products, {rows} rows exported to {out_dir} as {", ".join(args.formats)}', file=sys.stderr)
+
+
+def history(args, settings: Settings):
+    # answers go to stdout as csv
+    import csv
+
+    from lib.history import PriceHistory
+
+    store = PriceHistory(Path(settings.output['history_file']))
+    writer = csv.writer(sys.stdout, delimiter=';')
+    try:
+        if args.query == 'sku':
+            writer.writerow(('article', 'barcode', 'seen', 'price', 'promo', 'status'))
+            writer.writerows(store.history(args.sku))
+        elif args.query == 'promos':
+            writer.writerow(('seen', 'article', 'barcode', 'name', 'category', 'promo_before', 'promo', 'price'))
+            writer.writerows(store.promo_changes(args.since, category=args.category))
+        elif args.query == 'index':
+            writer.writerow(('day', 'offers', 'index'))
+            for day in args.days:
+                offers, value = store.price_index(args.category, base=args.base, at=day)
+                writer.writerow((day, offers, '' if value is None else f'{value:.2f}'))
+        else:
+            for name in args.files:
+                with open(name, encoding='utf-8', newline='') as file:
+                    rows = csv.reader(file, delimiter=';')
+                    next(rows, None)
+                    changed = store.ingest(list(rows), category=args.category)
+                print(f'{name}: {changed} price changes', file=sys.stderr)
+    finally:
+        store.close()
+
+
+def bench(args):
+    import importlib
+
+    sys.argv = [f'bench.{args.benchmark}'] + args.arguments
+    importlib.import_module(f'bench.{args.benchmark}').main()
+
+
+def main(argv: list[str] = None):
+    args = parse_args(argv)
+    if args.command == 'bench':
+        bench(args)
+        return
+    settings = load_settings(args.config)
+    if args.command != 'crawl' or args.coordinator or args.worker or args.merge:
+        require_config(settings, args.config, command=args.command)
+    if args.command == 'history':
+        history(args, settings)
+    elif args.command == 'export':
+        export(args, settings)
+    else:
+        set_logging_file(settings)
+        if args.command == 'crawl':
+            run_crawl(args, settings)
+        else:
+            refresh_tree(args, settings)
+
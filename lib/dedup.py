@@ -0,0 +1,30 @@
+import threading
+
+ARTICLE = 'article'
+BARCODE = 'barcode'
+
+
+class DedupIndex:
+    # hashed index of every article and barcode claimed during the run together with the product that claimed it
+    # it lives in memory only: a resumed run claims the rows of its journal again, which are the products
+    # it has written, so nothing claimed by a product that never made it to the journal is left behind
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owners: dict[tuple[str, str], tuple[str, str]] = {}
+
+    @staticmethod
+    def keys(article: str, barcode: str) -> list[tuple[str, str]]:
+        # an offer without article or barcode has nothing to collide with
+        return [(kind, str(value)) for kind, value in ((ARTICLE, article), (BARCODE, barcode)) if value]
+
+    def claim(self, article: str, barcode: str, href: str = '', category: str = '') -> tuple[str, str] | None:
+        # returns the owner (href, category) if the article or barcode has been claimed already,
+        # otherwise claims both for the given product and returns None
+        keys = self.keys(article, barcode)
+        with self.lock:
+            for key in keys:
+                if key in self.owners:
+                    return self.owners[key]
+            for key in keys:
+                self.owners[key] = (href, category)
+        return None
@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from lib.ratelimit import RATE_LIMIT, AdaptiveRate, backoff_s
+
+
+class FetchEngine:
+    # bounded thread pool for network-bound work
+    # every request to a host takes one of `per_host_limit` slots and a token of the adaptive rate of the host;
+    # delay_range keeps the meaning of the random delays it used to be: a host is never asked more often than
+    # per_host_limit times in delay_range[0] seconds, whatever rate the limiter has come to, and starts at
+    # per_host_limit requests in delay_range[1] seconds, which the rate may also fall back to on throttling
+    def __init__(self, workers: int = 8, per_host_limit: int = 4, delay_range: list = None, rate_limit: dict = None):
+        self.workers = max(1, workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.delay_range = delay_range if delay_range else [0, 0]
+        self.rate_limit = {**RATE_LIMIT, **(rate_limit or {})}
+        if self.delay_range[0] > 0:
+            self.rate_limit['max_rps'] = min(self.rate_limit['max_rps'], self.per_host_limit / self.delay_range[0])
+        if self.delay_range[1] > 0:
+            slowest = self.per_host_limit / self.delay_range[1]
+            self.rate_limit['initial_rps'] = min(self.rate_limit['initial_rps'], slowest)
+            self.rate_limit['min_rps'] = min(self.rate_limit['min_rps'], slowest)
+        self.hosts: dict[str, threading.BoundedSemaphore] = {}
+        self.rates: dict[str, AdaptiveRate] = {}
+        self.hosts_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='fetch')
+
+    def host_slots(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self.hosts_lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.hosts[host]
+
+    def rate(self, url: str) -> AdaptiveRate:
+        host = urlsplit(url).netloc
+        with self.hosts_lock:
+            if host not in self.rates:
+                self.rates[host] = AdaptiveRate(host, burst=self.per_host_limit, **self.rate_limit)
+            return self.rates[host]
+
+    @contextmanager
+    def polite(self, url: str):
+        with self.host_slots(url):
+            self.rate(url).acquire()
+            yield
+
+    def observe(self, url: str, seconds: float, status: int, retry_after: float = 0.0):
+        self.rate(url).observe(seconds, status, retry_after)
+
+    def backoff(self, attempt: int, retry_after: float = 0.0) -> float:
+        return backoff_s(attempt, retry_after, base_s=self.rate_limit['backoff_base_s'],
+                         max_s=self.rate_limit['backoff_max_s'])
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        return self.executor.submit(func, *args, **kwargs)
+
+    def run(self, func, items):
+        # yields (item, result) pairs in order of completion
+        futures = {self.executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,108 @@
+from time import perf_counter, sleep
+
+import requests
+from bs4 import BeautifulSoup
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+from lib.cache import PageCache
+from lib.engine import FetchEngine
+from lib.metrics import Metrics
+from lib.ratelimit import RETRY_STATUSES, retry_after_s
+
+# every page of the site is requested with 50 goods per page in the 'filling' view
+PAGE_PARAMS = {'pc': 50, 'v': 'filling'}
+
+
+def page_of(result: requests.Response) -> requests.Response:
+    # an error page left after the retries is never taken for the page itself: parsed, journaled or cached
+    if result.status_code != 200:
+        raise requests.HTTPError(f'{result.status_code} {result.reason} from {result.url}', response=result)
+    return result
+
+
+class Fetcher:
+    # the only way out to the network: one keep-alive session with retries and headers,
+    # shared by Parser, Category and Product
+    def __init__(self, headers: dict = None, max_retries: int = 0, pool_size: int = 8, engine: FetchEngine = None,
+                 cache: PageCache = None, metrics: Metrics = None):
+        self.engine = engine if engine else FetchEngine()
+        self.cache = cache
+        self.metrics = metrics
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        # urllib3 only retries broken connections, answers to retry are scheduled by get with the slot given back
+        retry_strategy = Retry(
+            total=max_retries,
+            status_forcelist=[],
+            allowed_methods=["GET"]
+        )
+        # pool_maxsize must cover all workers, otherwise urllib3 drops the extra connections after each request
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=4,
+                              pool_maxsize=max(pool_size, self.engine.workers))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def get(self, url: str, params: dict = None, headers: dict = None, kind: str = '',
+            category: str = '') -> requests.Response:
+        # every attempt takes a per-host slot and a token of the adaptive rate of the host,
+        # the backoff between attempts is waited out of the slot, so other requests to the host go on
+        started = perf_counter()
+        attempt = 0
+        while True:
+            with self.engine.polite(url):
+                sent = perf_counter()
+                try:
+                    result = self.session.get(url, params=params, headers=headers)
+                except Exception:
+                    if self.metrics is not None:
+                        self.metrics.record_fetch(kind, category, perf_counter() - started, 0, retries=attempt,
+                                                  error=True)
+                    raise
+            retry_after = retry_after_s(result.headers.get('Retry-After'))
+            self.engine.observe(url, perf_counter() - sent, result.status_code, retry_after)
+            if result.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                break
+            attempt += 1
+            delay = self.engine.backoff(attempt, retry_after)
+            logger.warning(f'{result.status_code} from {url}, attempt {attempt + 1} of {self.max_retries + 1} '
+                           f'in {delay:.1f}s')
+            sleep(delay)
+        if self.metrics is not None:
+            retries = result.raw.retries if result.raw is not None else None
+            self.metrics.record_fetch(kind, category, perf_counter() - started, len(result.content),
+                                      retries=attempt + (len(retries.history) if retries is not None else 0),
+                                      error=result.status_code >= 400)
+        return result
+
+    def get_text(self, url: str, params: dict = None, kind: str = '', category: str = '') -> str:
+        if self.cache is None:
+            return page_of(self.get(url, params=params, kind=kind, category=category)).text
+        # a page fresh for its kind costs nothing, a stale one is revalidated and costs a 304 if unchanged
+        key = self.cache.key(url, params)
+        entry = self.cache.lookup(key)
+        if entry is not None and (self.cache.offline or entry.fresh(self.cache.ttl(kind))):
+            return entry.text
+        # a page missing offline fails like an error page, an empty one would pass for an empty category
+        if self.cache.offline:
+            raise LookupError(f'offline: {key} is not in the cache')
+        result = self.get(url, params=params, headers=entry.conditional_headers() if entry else None, kind=kind,
+                          category=category)
+        if result.status_code == 304 and entry is not None:
+            self.cache.revalidated(key)
+            return entry.text
+        page_of(result)
+        self.cache.store(key, kind, result.text, etag=result.headers.get('ETag'),
+                         last_modified=result.headers.get('Last-Modified'))
+        return result.text
+
+    def get_soup(self, url: str, params: dict = None, kind: str = '') -> BeautifulSoup:
+        return BeautifulSoup(self.get_text(url, params=params, kind=kind), 'lxml')
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+
+from lib.normalize import number
+
+# the end of the range of categories under a prefix, no link has characters above it
+LAST = '\U0010ffff'
+
+
+def day_after(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+class PriceHistory:
+    # prices of every offer over the runs, keyed by article and barcode; a price row is only added when
+    # price, promo price or status have changed since the last time the offer was seen, so a run that changes
+    # nothing costs an update of last_seen per offer. Times are the price_datetime of the goods rows, iso strings
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS skus (id INTEGER PRIMARY KEY, article TEXT, barcode TEXT, name TEXT,
+                                             category TEXT, link TEXT, price REAL, promo REAL, status INTEGER,
+                                             first_seen TEXT, last_seen TEXT, UNIQUE (article, barcode));
+            CREATE INDEX IF NOT EXISTS skus_barcode ON skus (barcode);
+            CREATE INDEX IF NOT EXISTS skus_category ON skus (category);
+            CREATE TABLE IF NOT EXISTS prices (sku INTEGER, seen TEXT, price REAL, promo REAL, status INTEGER,
+                                               promo_changed INTEGER, PRIMARY KEY (sku, seen)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS prices_promo ON prices (seen) WHERE promo_changed = 1;
+        ''')
+        # the last known state of every offer: (article, barcode) -> [id, price, promo, status, last_seen]
+        self.state: dict[tuple[str, str], list] = {}
+        for sku, article, barcode, price, promo, status, last_seen in self.connection.execute(
+                'SELECT id, article, barcode, price, promo, status, last_seen FROM skus'):
+            self.state[(article, barcode)] = [sku, price, promo, status, last_seen]
+
+    def ingest(self, rows: list[tuple], category: str = '') -> int:
+        # goods rows of a run in, the amount of price rows added out; rows older than what is known of their
+        # offer (a resumed run restoring its journal, daily files loaded out of order) change nothing
+        added = 0
+        with self.lock:
+            seen_updates = []
+            for row in rows:
+                barcode, article = str(row[4] or ''), str(row[5] or '')
+                if not article and not barcode:
+                    continue
+                seen = str(row[0])
+                price, promo = number(row[1]), number(row[2])
+                status = int(row[3]) if str(row[3]).strip().isdigit() else None
+                state = self.state.get((article, barcode))
+                if state is None:
+                    cursor = self.connection.execute(
+                        'INSERT INTO skus VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (article, barcode, row[6], category, row[12], price, promo, status, seen, seen))
+                    state = self.state[(article, barcode)] = [cursor.lastrowid, None, None, None, seen]
+                    promo_changed = promo is not None
+                elif seen <= state[4]:
+                    continue
+                elif (price, promo, status) == tuple(state[1:4]):
+                    state[4] = seen
+                    seen_updates.append((seen, state[0]))
+                    continue
+                else:
+                    promo_changed = promo != state[2]
+                    self.connection.execute("UPDATE skus SET name = ?, category = coalesce(nullif(?, ''), category), "
+                                            'link = ?, price = ?, promo = ?, status = ?, last_seen = ? WHERE id = ?',
+                                            (row[6], category, row[12], price, promo, status, seen, state[0]))
+                self.connection.execute('INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?)',
+                                        (state[0], seen, price, promo, status, int(promo_changed)))
+                state[1:] = [price, promo, status, seen]
+                added += 1
+            self.connection.executemany('UPDATE skus SET last_seen = ? WHERE id = ?', seen_updates)
+            self.connection.commit()
+        return added
+
+    def history(self, sku: str) -> list[tuple]:
+        # (article, barcode, seen, price, promo, status) of every change of the offers with this article or barcode
+        with self.lock:
+            return self.connection.execute(
+                'SELECT s.article, s.barcode, p.seen, p.price, p.promo, p.status FROM skus s '
+                'JOIN prices p ON p.sku = s.id WHERE s.article = ? OR s.barcode = ? ORDER BY s.id, p.seen',
+                (sku, sku)).fetchall()
+
+    def promo_changes(self, since: str, category: str = '') -> list[tuple]:
+        # (seen, article, barcode, name, category, promo before, promo, price) of every promo price that
+        # has started, changed or ended since the given day or time, within a category and its subcategories
+        with self.lock:
+            return self.connection.execute(
+                'SELECT p.seen, s.article, s.barcode, s.name, s.category, '
+                '       (SELECT q.promo FROM prices q WHERE q.sku = p.sku AND q.seen < p.seen '
+                '        ORDER BY q.seen DESC LIMIT 1), p.promo, p.price '
+                'FROM prices p JOIN skus s ON s.id = p.sku '
+                'WHERE p.promo_changed = 1 AND p.seen >= ? AND s.category >= ? AND s.category < ? ORDER BY p.seen',
+                (since, category, category + LAST)).fetchall()
+
+    def price_index(self, category: str, base: str, at: str) -> tuple[int, float | None]:
+        # mean of the price relatives of the offers of a category (and its subcategories) known on both days:
+        # the last price (promo price if there is one) of day `at` against the one of day `base`, base = 100
+        with self.lock:
+            return self.connection.execute(
+                'WITH relatives AS ('
+                '    SELECT (SELECT coalesce(promo, price) FROM prices WHERE sku = s.id AND seen < ? '
+                '            ORDER BY seen DESC LIMIT 1) AS before, '
+                '           (SELECT coalesce(promo, price) FROM prices WHERE sku = s.id AND seen < ? '
+                '            ORDER BY seen DESC LIMIT 1) AS after '
+                '    FROM skus s WHERE s.category >= ? AND s.category < ?) '
+                'SELECT COUNT(*), AVG(after / before) * 100 FROM relatives WHERE before > 0 AND after IS NOT NULL',
+                (day_after(base), day_after(at), category, category + LAST)).fetchone()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
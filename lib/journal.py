@@ -0,0 +1,81 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class Journal:
+    # checkpoint journal of a crawl: page counts and product links of every category listing
+    # and the rows of every written product, so an interrupted run can go straight to the remainder
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS pages (category TEXT PRIMARY KEY, amount INTEGER);
+            CREATE TABLE IF NOT EXISTS links (category TEXT, page INTEGER, href TEXT, title TEXT, fingerprint TEXT,
+                                              PRIMARY KEY (category, page, href));
+            CREATE TABLE IF NOT EXISTS listed (category TEXT, page INTEGER, PRIMARY KEY (category, page));
+            CREATE TABLE IF NOT EXISTS products (href TEXT PRIMARY KEY, category TEXT, rows TEXT);
+        ''')
+        self.done = {href for href, in self.connection.execute('SELECT href FROM products')}
+
+    def execute(self, query: str, params: tuple = ()):
+        with self.lock:
+            self.connection.execute(query, params)
+            self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            for table in ('pages', 'links', 'listed', 'products'):
+                self.connection.execute(f'DELETE FROM {table}')
+            self.connection.commit()
+            self.done.clear()
+
+    def set_pages(self, category: str, amount: int):
+        self.execute('INSERT OR REPLACE INTO pages VALUES (?, ?)', (category, amount))
+
+    def pages(self, category: str) -> int | None:
+        with self.lock:
+            row = self.connection.execute('SELECT amount FROM pages WHERE category = ?', (category,)).fetchone()
+        return row[0] if row else None
+
+    def add_links(self, category: str, page: int, links: list[tuple[str, str, str]]):
+        with self.lock:
+            self.connection.executemany('INSERT OR IGNORE INTO links VALUES (?, ?, ?, ?, ?)',
+                                        [(category, page, href, title, fingerprint)
+                                         for href, title, fingerprint in links])
+            self.connection.execute('INSERT OR IGNORE INTO listed VALUES (?, ?)', (category, page))
+            self.connection.commit()
+
+    def listed_pages(self, category: str) -> set[int]:
+        with self.lock:
+            rows = self.connection.execute('SELECT page FROM listed WHERE category = ?', (category,)).fetchall()
+        return {page for page, in rows}
+
+    def links(self, category: str, page: int) -> list[tuple[str, str, str]]:
+        with self.lock:
+            return self.connection.execute('SELECT href, title, fingerprint FROM links '
+                                           'WHERE category = ? AND page = ?',
+                                           (category, page)).fetchall()
+
+    def mark_done(self, href: str, category: str, rows: list[tuple]):
+        self.execute('INSERT OR REPLACE INTO products VALUES (?, ?, ?)',
+                     (href, category, json.dumps(rows, ensure_ascii=False, default=str)))
+        self.done.add(href)
+
+    def is_done(self, href: str) -> bool:
+        return href in self.done
+
+    def done_products(self):
+        # yields (href, category, rows) of every product written before
+        with self.lock:
+            records = self.connection.execute('SELECT href, category, rows FROM products').fetchall()
+        for href, category, rows in records:
+            yield href, category, [tuple(row) for row in json.loads(rows)]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
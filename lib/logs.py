@@ -0,0 +1,76 @@
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+# products and their offers are logged on levels of their own, below INFO: the console and the run log
+# do not get them, they go to structured json sinks, and when no sink wants them
+# loguru drops the call before anything is formatted
+PRODUCT, OFFER = 'PRODUCT', 'OFFER'
+logger.level(PRODUCT, no=15)
+logger.level(OFFER, no=14)
+
+# summary - no product records at all; products - a json record per product; offers - also a record per offer
+SUMMARY, PRODUCTS, OFFERS = 'summary', 'products', 'offers'
+VERBOSITY = (SUMMARY, PRODUCTS, OFFERS)
+
+LOGGING = {
+    "enqueue": False,
+    "verbosity": PRODUCTS,
+    "buffer_kb": 256,
+    "rotation": "100 MB",
+    "retention": 10,
+    "compression": "gz"
+}
+
+TEXT_FORMAT = '{time:YYYY-MM-DD HH:mm:ss.SSS} » {message}'
+# fields of the records of a product and of an offer, in the order they are written
+PRODUCT_FIELDS = ('index', 'href', 'category', 'title', 'categories', 'country', 'offers')
+OFFER_FIELDS = ('index', 'href', 'article', 'barcode', 'min_value', 'price', 'promo_price', 'status')
+
+
+def json_format(fields: tuple, key: str):
+    # a json line out of the extra of a record: {"time": ..., "index": ..., "href": ..., ...}
+    def format_record(record) -> str:
+        extra = record['extra']
+        data = {'time': record['time'].isoformat(timespec='milliseconds')}
+        data.update((field, extra.get(field)) for field in fields)
+        extra[key] = json.dumps(data, ensure_ascii=False, default=str)
+        return '{extra[' + key + ']}\n'
+    return format_record
+
+
+def only(level: str):
+    return lambda record: record['level'].name == level
+
+
+def set_logging(logs_dir: str, suffix: str = '', config: dict = None):
+    # console: INFO and above, which is the progress line of the metrics and what the run is busy with;
+    # run log and error log as text; products and offers as json lines in rotated compressed files,
+    # written buffer_kb at a time instead of a write per line.
+    # with enqueue the sinks are written by a thread of their own out of a queue, which takes slow disks off
+    # the crawl, but pickling every record into the queue costs a caller more than a buffered write
+    config = {**LOGGING, **(config or {})}
+    if config['verbosity'] not in VERBOSITY:
+        raise ValueError(f'unknown logging verbosity {config["verbosity"]}, expected one of: {", ".join(VERBOSITY)}')
+    log_file_dir = Path(logs_dir)
+    log_file_dir.mkdir(exist_ok=True)
+    stamp = f'{datetime.now().strftime("%Y-%m-%d %H-%M-%S")}{suffix}'
+    enqueue = config['enqueue']
+    rotated = {'rotation': config['rotation'], 'retention': config['retention'],
+               'compression': config['compression'] or None, 'buffering': config['buffer_kb'] * 1024}
+    logger.remove()
+    logger.add(sink=sys.stdout, level='INFO', format='{message}', enqueue=enqueue)
+    logger.add(sink=log_file_dir / f'log-{stamp}.log', encoding='utf-8', level='INFO', format=TEXT_FORMAT,
+               enqueue=enqueue)
+    logger.add(sink=log_file_dir / f'log-{stamp}-errors.log', encoding='utf-8', level='ERROR', format=TEXT_FORMAT,
+               enqueue=enqueue)
+    if config['verbosity'] in (PRODUCTS, OFFERS):
+        logger.add(sink=log_file_dir / f'products-{stamp}.jsonl', encoding='utf-8', level=PRODUCT,
+                   filter=only(PRODUCT), format=json_format(PRODUCT_FIELDS, 'product_json'), enqueue=enqueue,
+                   **rotated)
+    if config['verbosity'] == OFFERS:
+        logger.add(sink=log_file_dir / f'offers-{stamp}.jsonl', encoding='utf-8', level=OFFER,
+                   filter=only(OFFER), format=json_format(OFFER_FIELDS, 'offer_json'), enqueue=enqueue, **rotated)
@@ -0,0 +1,188 @@
+import json
+import threading
+import tracemalloc
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import monotonic
+
+from loguru import logger
+
+
+class Histogram:
+    # raw samples in a compact double array, percentiles are taken once on demand
+    __slots__ = ('samples',)
+
+    def __init__(self):
+        self.samples = array('d')
+
+    def add(self, value: float):
+        self.samples.append(value)
+
+    def percentile(self, ordered: list[float], q: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        return {'count': len(ordered), 'sum': sum(ordered),
+                'p50': self.percentile(ordered, 50), 'p95': self.percentile(ordered, 95),
+                'p99': self.percentile(ordered, 99), 'max': ordered[-1] if ordered else 0.0}
+
+
+class CategoryCounters:
+    __slots__ = ('requests', 'bytes', 'retries', 'errors', 'products', 'started', 'finished')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.retries = 0
+        self.errors = 0
+        self.products = 0
+        self.started = monotonic()
+        self.finished = None
+
+    def summary(self) -> dict:
+        elapsed = (self.finished or monotonic()) - self.started
+        return {'requests': self.requests, 'bytes': self.bytes, 'retries': self.retries, 'errors': self.errors,
+                'products': self.products, 'seconds': elapsed,
+                'products_per_s': self.products / elapsed if elapsed > 0 else 0.0}
+
+
+class Metrics:
+    # timings and counters of a crawl: fetch latency and parse time by page kind, bytes, retries, errors and
+    # products by category; summarised into json at the end of the run
+    def __init__(self, trace_memory: bool = False):
+        self.lock = threading.Lock()
+        self.started = monotonic()
+        self.fetch_latency: dict[str, Histogram] = {}
+        self.parse_time: dict[str, Histogram] = {}
+        self.categories: dict[str, CategoryCounters] = {}
+        self.trace_memory = trace_memory
+        self.progress_thread: threading.Thread = None
+        self.progress_stop = threading.Event()
+        self.server: ThreadingHTTPServer = None
+
+    def category(self, category: str) -> CategoryCounters:
+        if category not in self.categories:
+            self.categories[category] = CategoryCounters()
+        return self.categories[category]
+
+    def record_fetch(self, kind: str, category: str, seconds: float, size: int, retries: int = 0,
+                     error: bool = False):
+        with self.lock:
+            self.fetch_latency.setdefault(kind, Histogram()).add(seconds)
+            counters = self.category(category)
+            counters.requests += 1
+            counters.bytes += size
+            counters.retries += retries
+            counters.errors += 1 if error else 0
+
+    def record_parse(self, kind: str, seconds: float):
+        with self.lock:
+            self.parse_time.setdefault(kind, Histogram()).add(seconds)
+
+    def record_error(self, category: str):
+        with self.lock:
+            self.category(category).errors += 1
+
+    def record_product(self, category: str):
+        with self.lock:
+            self.category(category).products += 1
+
+    def category_done(self, category: str):
+        with self.lock:
+            self.category(category).finished = monotonic()
+
+    def totals(self) -> dict:
+        with self.lock:
+            products = sum(counters.products for counters in self.categories.values())
+            elapsed = monotonic() - self.started
+            totals = {'seconds': elapsed, 'products': products,
+                      'products_per_s': products / elapsed if elapsed > 0 else 0.0,
+                      'requests': sum(counters.requests for counters in self.categories.values()),
+                      'bytes': sum(counters.bytes for counters in self.categories.values()),
+                      'retries': sum(counters.retries for counters in self.categories.values()),
+                      'errors': sum(counters.errors for counters in self.categories.values())}
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            totals.update({'traced_memory': current, 'traced_memory_peak': peak})
+        return totals
+
+    def summary(self) -> dict:
+        totals = self.totals()
+        with self.lock:
+            return {'totals': totals,
+                    'fetch_latency_s': {kind: hist.summary() for kind, hist in self.fetch_latency.items()},
+                    'parse_time_s': {kind: hist.summary() for kind, hist in self.parse_time.items()},
+                    'categories': {name: counters.summary() for name, counters in self.categories.items()}}
+
+    def write(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.summary(), ensure_ascii=False, indent=2), encoding='utf-8')
+        logger.info(f'Metrics of the run have been written to {path}')
+
+    def progress_line(self) -> str:
+        totals = self.totals()
+        line = (f"[progress] {totals['products']} products in {totals['seconds']:.0f}s "
+                f"({totals['products_per_s']:.1f}/s) | {totals['requests']} requests, "
+                f"{totals['bytes'] / 2 ** 20:.1f} MB, {totals['retries']} retries, {totals['errors']} errors")
+        if 'traced_memory' in totals:
+            line += f" | traced memory {totals['traced_memory'] / 2 ** 20:.1f} MB"
+        return line
+
+    def start_progress(self, interval_s: float):
+        if interval_s <= 0:
+            return
+
+        def report():
+            while not self.progress_stop.wait(interval_s):
+                logger.info(self.progress_line())
+
+        self.progress_thread = threading.Thread(target=report, name='progress', daemon=True)
+        self.progress_thread.start()
+
+    def prometheus(self) -> str:
+        summary = self.summary()
+        lines = []
+        for name, value in summary['totals'].items():
+            lines.append(f'zoo_parser_{name} {value}')
+        for section, metric in (('fetch_latency_s', 'zoo_parser_fetch_latency_seconds'),
+                                ('parse_time_s', 'zoo_parser_parse_seconds')):
+            for kind, hist in summary[section].items():
+                for q in ('p50', 'p95', 'p99'):
+                    lines.append(f'{metric}{{kind="{kind}",quantile="0.{q[1:]}"}} {hist[q]}')
+                lines.append(f'{metric}_count{{kind="{kind}"}} {hist["count"]}')
+                lines.append(f'{metric}_sum{{kind="{kind}"}} {hist["sum"]}')
+        for category, counters in summary['categories'].items():
+            for name in ('requests', 'bytes', 'retries', 'errors', 'products'):
+                lines.append(f'zoo_parser_category_{name}{{category="{category}"}} {counters[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int):
+        # local prometheus text endpoint at http://127.0.0.1:<port>/metrics
+        if port <= 0:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+
+    def stop(self):
+        self.progress_stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,88 @@
+import re
+
+WEIGHT, VOLUME, QUANTITY = 'kg', 'l', 'pcs'
+# unit as it is written on the site -> canonical unit and the factor to it
+UNITS = {'кг': (WEIGHT, 1.0), 'гр': (WEIGHT, 0.001), 'г': (WEIGHT, 0.001),
+         'мл': (VOLUME, 0.001), 'л': (VOLUME, 1.0), 'шт': (QUANTITY, 1.0)}
+UNIT_PATTERN = '|'.join(UNITS)
+# a number with a unit that is a word of its own: '400 г', '0,4кг', '3 шт.', but neither 'гель' nor '2 гранулы'
+MEASURE = re.compile(rf'(\d+(?:[.,]\d+)?)\s*({UNIT_PATTERN})(?![а-яёa-z])', re.IGNORECASE)
+# the same for RE2 of arrow, which has no lookahead: the character after the unit is matched instead
+MEASURE_RE2 = rf'(?i)(?P<value>\d+(?:[.,]\d+)?)\s*(?P<unit>{UNIT_PATTERN})(?:[^а-яёa-z]|$)'
+PRICE_RE2 = r'^\d+(?:\.\d+)?$'
+PRICE = re.compile(PRICE_RE2)
+
+# columns the batch pass adds to the goods columns
+NORMALIZED = ('quantity', 'unit', 'price_per_unit')
+
+
+def measure(text: str) -> tuple[float, str] | None:
+    # '400 г' -> (0.4, 'kg'), one regex pass for weight, volume and quantity
+    found = MEASURE.search(text or '')
+    if found is None:
+        return None
+    unit, factor = UNITS[found.group(2).lower()]
+    return float(found.group(1).replace(',', '.')) * factor, unit
+
+
+def measure_unit(text: str) -> str:
+    found = MEASURE.search(text or '')
+    return UNITS[found.group(2).lower()][0] if found is not None else ''
+
+
+def number(text) -> float | None:
+    # '1 234,50 р' -> 1234.5; empty and broken prices -> None, the same as numbers does for a column
+    cleaned = re.sub(r'[^\d,.]', '', '' if text is None else str(text)).replace(',', '.')
+    return float(cleaned) if PRICE.match(cleaned) else None
+
+
+def arrow():
+    # the batch pass runs on arrow columns; pyarrow is optional, it is only needed for the columnar outputs,
+    # and is loaded by the first batch, so the per-row helpers (the price history) do not pay for it
+    try:
+        import pyarrow
+        import pyarrow.compute as pc
+    except ImportError:
+        raise ImportError('normalization of offers needs pyarrow: pip install pyarrow') from None
+    return pyarrow, pc
+
+
+def null_if_empty(strings):
+    pyarrow, pc = arrow()
+    return pc.if_else(pc.equal(strings, ''), pyarrow.scalar(None, pyarrow.string()), strings)
+
+
+def numbers(strings):
+    # '1 234,50 р' -> 1234.5; empty and broken prices -> null
+    pyarrow, pc = arrow()
+    cleaned = pc.replace_substring(pc.replace_substring_regex(strings, r'[^\d,.]', ''), ',', '.')
+    cleaned = pc.if_else(pc.match_substring_regex(cleaned, PRICE_RE2), cleaned,
+                         pyarrow.scalar(None, pyarrow.string()))
+    return pc.cast(cleaned, pyarrow.float64())
+
+
+def normalize_offers(columns: dict):
+    # goods columns of a batch as arrow string arrays in, typed and normalized ones out:
+    # prices as doubles, price_datetime as timestamp, status as int, plus quantity in kg / l / pcs,
+    # its canonical unit and the price per unit (promo price if there is one)
+    pyarrow, pc = arrow()
+    result = dict(columns)
+    result['price_datetime'] = pc.cast(null_if_empty(columns['price_datetime']), pyarrow.timestamp('us'))
+    result['price'] = numbers(columns['price'])
+    result['price_promo'] = numbers(columns['price_promo'])
+    result['sku_status'] = pc.cast(null_if_empty(columns['sku_status']), pyarrow.int8())
+    # only one of the three is filled for an offer, it is min_value of the offer
+    text = pc.if_else(pc.not_equal(columns['sku_weight_min'], ''), columns['sku_weight_min'],
+                      pc.if_else(pc.not_equal(columns['sku_volume_min'], ''), columns['sku_volume_min'],
+                                 columns['sku_quantity_min']))
+    parts = pc.extract_regex(text, MEASURE_RE2)
+    index = pc.index_in(pc.utf8_lower(pc.struct_field(parts, 'unit')), value_set=pyarrow.array(list(UNITS)))
+    factors = pc.take(pyarrow.array([factor for _, factor in UNITS.values()]), index)
+    value = pc.replace_substring(pc.struct_field(parts, 'value'), ',', '.')
+    quantity = pc.multiply(pc.cast(value, pyarrow.float64()), factors)
+    result['quantity'] = quantity
+    result['unit'] = pc.take(pyarrow.array([unit for unit, _ in UNITS.values()]), index)
+    price = pc.coalesce(result['price_promo'], result['price'])
+    result['price_per_unit'] = pc.if_else(pc.greater(quantity, 0), pc.divide(price, quantity),
+                                          pyarrow.scalar(None, pyarrow.float64()))
+    return result
@@ -1,69 +1,116 @@
 import csv
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from random import uniform
-from time import sleep
 
-import requests
-from bs4 import BeautifulSoup
 from loguru import logger
-from requests.adapters import HTTPAdapter
 import tracemalloc
-from urllib3 import Retry
+from time import perf_counter
 
-from lib.category import Category, STAGES
-from lib.helper import tags
+from lib.backends import Card, Listing, extract_card_page, get_backend
+from lib.cache import CARD, LISTING, PageCache
+from lib.category import Category
+from lib.dedup import DedupIndex
+from lib.engine import FetchEngine
+from lib.fetcher import Fetcher, PAGE_PARAMS
+from lib.journal import Journal
+from lib.metrics import Metrics
+from lib.pipeline import Pipeline
 from lib.product import Product
+from lib.ratelimit import RATE_LIMIT
+from lib.registry import CategoryRegistry, get_stage_out_of_url
+from lib.scheduler import CategoryScheduler
 from lib.settings import Settings
+from lib.sinks import GoodsSinks, open_sinks
+from lib.snapshot import ListingSnapshot, REMOVED
+from lib.tree import TreeBuilder, TreeSnapshot
+from lib.writer import DELTA_HEADERS, GoodsWriter
 
 ZOO_URL = 'https://zootovary.ru'
 CATALOG = '/catalog/'
 
 headers = ['name', 'id', 'parent_id', 'link']
-codes = {1: {}, 2: {}, 3: {}, 4: {}}
 
 
-def get_category_code_by_url(url: str) -> int:
-    stage = get_stage_out_of_url(url)
-    if stage == 0:
-        return 0
-    if url not in codes[stage].keys():
-        codes[stage][url] = len(codes[stage]) + 1
-
-    code = codes[stage][url] * STAGES[stage - 1]['multiplier'] + get_category_code_by_url(
-        get_less_one_level_of_link(url))
-    return code
-
-
-def get_stage_out_of_url(url: str) -> int:
-    parts = len(url[1:-1].split('/'))
-    return parts - 1
-
-
-def get_less_one_level_of_link(url):
-    parts = url[1:-1].split('/')
-    return '/' + '/'.join(parts[:-1]) + '/'
+def get_category_code_by_url(url: str, registry: CategoryRegistry) -> int:
+    return registry.code(url)
 
 
 class Parser:
-    def __init__(self, settings: Settings):
-        self.session = requests.Session()
+    def __init__(self, settings: Settings, resume: bool = False, offline: bool = False, trace_memory: bool = False):
+        self.resume = resume
+        self.offline = offline
+        self.fetcher: Fetcher = None
         self.amount_of_pages: dict[str, int] = {}
         self.category_is_parsed: dict[str, bool] = {}
+        # first listing pages loaded while sizes of the categories were estimated, taken by parse_cards
+        self.first_listings: dict[str, Listing] = {}
         # config parameters
         self.out_dir = Path('out')
+        # the site is taken from the config, so the crawler can be pointed at a local stand-in of it
+        self.base_url = ZOO_URL
         self.logs_dir = Path('logs')
         self.max_retries = 0
         self.required_categories_list = [CATALOG]
         self.required_categories_provided: bool = False
-        self.products_list_by_category: dict[str, list] = {}
-        self.parsed_articles_list: list[str] = []
-        self.parsed_barcodes_list: list[str] = []
+        # products are not kept after they have been written, only their amount by category
+        self.amount_of_products: dict[str, int] = {}
+        self.goods_writer: GoodsSinks = None
+        self.delta_writer: GoodsWriter = None
+        self.snapshot: ListingSnapshot = None
+        # categories whose every listing page has been loaded in this run, only out of these can products be gone
+        self.listed: set[str] = set()
+        self.journal_file = 'out/journal.sqlite'
+        self.cache = {
+            "enabled": False,
+            "path": "cache/pages.sqlite",
+            "max_size_mb": 512,
+            "ttl_h": {"menu": 24, "listing": 1, "card": 12}
+        }
+        self.parser_backend = 'soup'
+        self.parse_processes = 0
+        self.lazy_tree = False
+        self.tree = {
+            "snapshot_file": "out/tree.jsonl",
+            "registry_file": "out/category_ids.json",
+            "refresh_h": 24
+        }
+        self.tree_discovered = False
+        # goods go to every format listed: csv, csv.gz, csv.zst and typed parquet or arrow partitioned
+        # by run date and category, written batch_rows rows at a time; history adds the changed prices
+        # of the run to the price history in history_file
+        self.output = {
+            "formats": ["csv"],
+            "batch_rows": 500,
+            "history_file": "out/history.sqlite"
+        }
+        self.trace_memory = False
+        self.metrics_config = {
+            "summary_file": "metrics.json",
+            "progress_s": 30,
+            "prometheus_port": 0
+        }
+        self.parse_pool: ProcessPoolExecutor = None
+        self.incremental = {
+            "enabled": False,
+            "snapshot_file": "out/snapshot.sqlite",
+            "delta_file": "goods-delta.csv"
+        }
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
                           "Chrome/104.0.5112.124 YaBrowser/22.9.5.710 Yowser/2.5 Safari/537.36",
             "Accept-Language": "ru"
         }
         self.delay_range = [0, 0]
+        # requests per second of a host follow its answers, see lib.ratelimit
+        self.rate_limit = dict(RATE_LIMIT)
+        self.workers = 8
+        # categories crawled side by side, largest first
+        self.category_workers = 4
+        self.per_host_limit = 4
+        self.pool_size = 8
+        self.queue_size = 100
         self.restart = {
             "restart_count": 3,
             "interval_m": 0.2
@@ -72,39 +119,74 @@ class Parser:
         self.category_parsed_tree: dict[str, Category] = {}
         #
         self.apply_config(settings=settings)
+        # listing and card pages are parsed by the configured backend: soup, strainer or lxml
+        self.backend = get_backend(self.parser_backend)
+        # memory tracing costs on every allocation, so it is only switched on when asked for
+        self.trace_memory = self.trace_memory or trace_memory
+        self.metrics = Metrics(trace_memory=self.trace_memory)
+        # category ids stay the same between runs, the tree itself is taken out of its snapshot while it is fresh
+        self.registry = CategoryRegistry(Path(self.tree['registry_file']))
+        self.tree_snapshot = TreeSnapshot(Path(self.tree['snapshot_file']), refresh_h=self.tree['refresh_h'])
+        # every article and barcode claimed by a parsed product
+        self.dedup = DedupIndex()
+        # checkpoints of the run, a fresh run starts with an empty journal
+        self.journal = Journal(Path(self.journal_file))
+        if not self.resume:
+            self.journal.clear()
+        # only new products and products whose listing block has changed are fetched in incremental mode
+        if self.incremental['enabled']:
+            self.snapshot = ListingSnapshot(Path(self.incremental['snapshot_file']))
+            self.snapshot.begin_run(resume=self.resume)
+        self.engine = FetchEngine(workers=self.workers, per_host_limit=self.per_host_limit,
+                                  delay_range=self.delay_range, rate_limit=self.rate_limit)
 
     def apply_config(self, settings: Settings) -> None:
         if not settings.provided:
             return
         self.out_dir = Path(settings.output_directory)
+        self.base_url = settings.base_url
         self.logs_dir = settings.logs_dir
         self.max_retries = settings.max_retries
         self.headers = settings.headers
         self.delay_range = settings.delay_range
+        self.rate_limit = settings.rate_limit
+        self.workers = settings.workers
+        self.category_workers = settings.category_workers
+        self.per_host_limit = settings.per_host_limit
+        self.pool_size = settings.pool_size
+        self.queue_size = settings.queue_size
+        self.journal_file = settings.journal_file
+        self.cache = settings.cache
+        self.incremental = settings.incremental
+        self.parser_backend = settings.parser_backend
+        self.parse_processes = settings.parse_processes
+        self.lazy_tree = settings.lazy_tree
+        self.tree = settings.tree
+        self.output = settings.output
+        self.trace_memory = settings.trace_memory
+        self.metrics_config = settings.metrics
         self.restart = settings.restart
         if len(settings.categories) > 0:
             self.required_categories_list = settings.categories
         self.required_categories_provided = True if len(settings.categories) > 0 else False
 
     def setup_session(self) -> None:
-        retry_strategy = Retry(
-            total=self.max_retries,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["GET"]
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("https://", adapter)
-        self.session.mount("http://", adapter)
-        self.session.headers.update(self.headers)
-
-    def get_soup_out_of_page_with_url(self, url: str, params: dict = None) -> BeautifulSoup:
-        # randomized delay according to settings
-        sleep(uniform(self.delay_range[0], self.delay_range[1]))
-        # get soup out of page
-        result = self.session.get(url, params=params)
-        return BeautifulSoup(result.text, 'lxml')
-
-    def calc_amount_of_pages(self, soup, catalog_url: str = "") -> None:
+        # offline runs are replayed entirely out of the cache
+        cache = None
+        if self.cache['enabled'] or self.offline:
+            cache = PageCache(Path(self.cache['path']), max_size_mb=self.cache['max_size_mb'],
+                              ttl_h=self.cache['ttl_h'], offline=self.offline)
+        self.fetcher = Fetcher(headers=self.headers, max_retries=self.max_retries, pool_size=self.pool_size,
+                               engine=self.engine, cache=cache, metrics=self.metrics)
+
+    def get_listing_out_of_page_with_url(self, url: str, params: dict = None, catalog_url: str = '') -> Listing:
+        text = self.fetcher.get_text(url, params=params, kind=LISTING, category=catalog_url)
+        started = perf_counter()
+        listing = self.backend.listing(text)
+        self.metrics.record_parse(LISTING, perf_counter() - started)
+        return listing
+
+    def calc_amount_of_pages(self, listing: Listing, catalog_url: str = "") -> None:
         # we load each page with 50 foods displayed on it according to parameter 'pc': 50 of the page request
         # in order to find the latest possible page we need to understand do we have more than 50 goods in a category
         #
@@ -114,22 +196,20 @@ class Parser:
         # if no than we must check if we have any goods to display
         #   if we have 0 goods -> we have 0 pages to analyze
         #   if we have more than 0 goods -> we have 1 page to display
-        count_products = len(soup.select('div.catalog-item'))
+        count_products = listing.count
         if count_products == 0:
             self.amount_of_pages[catalog_url] = 0
         elif 0 < count_products < 50:
             self.amount_of_pages[catalog_url] = 1
         else:
-            navigation_links = soup.find('div', {'class': 'navigation'})
-            for navi in tags(navigation_links):
-                if navi.getText() == '»':
-                    href = navi['href']
+            for text, href in listing.navigation:
+                if text == '»':
                     splits = href.split('=')
                     pages = int(splits[-1])
                     self.amount_of_pages[catalog_url] = pages
                     break
             else:
-                self.amount_of_pages[catalog_url] = len([x for x in tags(navigation_links)])
+                self.amount_of_pages[catalog_url] = len(listing.navigation)
         logger.info(f'        We found {self.amount_of_pages[catalog_url]} pages and {count_products} products '
                     f'on a first page of category: {catalog_url}')
 
@@ -138,58 +218,172 @@ class Parser:
             logger.warning(f'  Category {category} have been parsed already. Skipping...')
             return
 
-        self.category_parsed_tree[category] = Category(url=ZOO_URL + category, base_url=ZOO_URL, link=category,
-                                                       code=get_category_code_by_url(category),
-                                                       stage=get_stage_out_of_url(category))
+        root = self.tree_snapshot.load(category, base_url=self.base_url, fetcher=self.fetcher,
+                                       registry=self.registry)
+        if root is not None:
+            logger.info(f'  Category tree of {category} has been loaded out of {self.tree_snapshot.path}')
+            self.category_parsed_tree[category] = root
+            self.category_is_parsed[category] = True
+            return
+        # the tree is discovered breadth first with all the pages of a level fetched concurrently,
+        # a lazy tree is only looked down when its children are asked for
+        self.tree_discovered = True
+        root = Category(url=self.base_url + category, base_url=self.base_url, link=category,
+                        code=get_category_code_by_url(category, self.registry), stage=get_stage_out_of_url(category),
+                        fetcher=self.fetcher, lazy=True, registry=self.registry)
+        if not self.lazy_tree:
+            TreeBuilder(engine=self.engine).build(root)
+        self.category_parsed_tree[category] = root
         self.category_is_parsed[category] = True
 
-    @staticmethod
-    def parse_block(item):
-        data = item.select_one('a.name')
-        return [data['href'], data['title']]
+    def products_out_of_listing(self, listing: Listing, catalog_url: str = '', page: int = 1) -> list[Product]:
+        self.journal.add_links(catalog_url, page, listing.blocks)
+        return [Product(href, title, category=catalog_url, fingerprint=fingerprint)
+                for href, title, fingerprint in listing.blocks]
 
-    def get_all_products_links_out_of_category(self, catalog_url: str = None):
+    def get_products_of_page(self, catalog_url: str, page: int) -> list[Product]:
+        logger.info(f'         Analysing {page} page out of {self.amount_of_pages[catalog_url]}')
+        params = {**PAGE_PARAMS, 'PAGEN_1': page}
+        listing = self.get_listing_out_of_page_with_url(self.base_url + catalog_url, params=params,
+                                                        catalog_url=catalog_url)
+        return self.products_out_of_listing(listing, catalog_url=catalog_url, page=page)
+
+    def get_all_products_links_out_of_category(self, catalog_url: str = None, listing: Listing = None):
+        # yields products page by page as soon as each listing page lands
+        # the first page has been loaded already by parse_cards, so it is reused instead of being refetched
+        # pages listed by an interrupted run are taken out of the journal
+        self.amount_of_products[catalog_url] = 0
         if self.amount_of_pages[catalog_url] == 0:
-            self.products_list_by_category[catalog_url] = []
+            self.listed.add(catalog_url)
             return
 
-        for page in range(1, self.amount_of_pages[catalog_url] + 1):
-            logger.info(f'         Analysing {page} page out of {self.amount_of_pages[catalog_url]}')
-            params = {'pc': 50, 'v': 'filling', 'PAGEN_1': page}
-            soup = self.get_soup_out_of_page_with_url(ZOO_URL + catalog_url, params=params)
-            catalog_info = soup.select('div.catalog-content-info')
-            for item in catalog_info:
-                product = Product(*self.parse_block(item=item))
-                if catalog_url not in self.products_list_by_category.keys():
-                    self.products_list_by_category[catalog_url] = []
-                self.products_list_by_category[catalog_url].append(product)
-        logger.info(f'        We have found {len(self.products_list_by_category[catalog_url])} products to parse')
-
-    def parse_all_products_out_of_category(self, catalog_url: str = None):
-        logger.info(f'        Starting to parse products of {catalog_url} category')
-        for index, product in enumerate(self.products_list_by_category[catalog_url], start=1):
-            if product.parsed:
-                logger.warning(f"We already parsed this product: [{product['title']}|{product['href']}]")
+        listed = self.journal.listed_pages(catalog_url)
+        for page in sorted(listed):
+            products = [Product(href, title, category=catalog_url, fingerprint=fingerprint)
+                        for href, title, fingerprint in self.journal.links(catalog_url, page)]
+            yield from self.not_parsed_yet(catalog_url, products)
+        pages = [page for page in range(1, self.amount_of_pages[catalog_url] + 1) if page not in listed]
+        if listing is not None and 1 in pages:
+            pages.remove(1)
+            yield from self.not_parsed_yet(catalog_url, self.products_out_of_listing(listing, catalog_url=catalog_url))
+        for _, products in self.engine.run(lambda page: self.get_products_of_page(catalog_url, page), pages):
+            yield from self.not_parsed_yet(catalog_url, products)
+        self.listed.add(catalog_url)
+        logger.info(f'        We have found {self.amount_of_products[catalog_url]} products to parse')
+
+    def not_parsed_yet(self, catalog_url: str, products: list[Product]):
+        self.amount_of_products[catalog_url] += len(products)
+        for product in products:
+            if self.journal.is_done(product.href):
                 continue
-            index = f'{index}/{len(self.products_list_by_category[catalog_url])}'
-            product.parse(articles=self.parsed_articles_list, barcodes=self.parsed_barcodes_list, index=index)
-            logger.info(tracemalloc.get_traced_memory())
-        logger.info(f'        Done | Products from {catalog_url} have been parsed')
+            if self.snapshot is not None:
+                # a listed product is still on the site, whether its card is fetched in this run or not
+                self.snapshot.seen(product.href)
+                product.change = self.snapshot.change(product.href, product.fingerprint)
+                if not product.change:
+                    self.write_unchanged(product)
+                    continue
+            yield product
+
+    def write_unchanged(self, product: Product):
+        # the card has not changed since the previous run, its rows go to the full snapshot as they were
+        # its offers claim their articles and barcodes the way Product.apply_card does, cut at the first one
+        # claimed by another product
+        rows = []
+        for row in self.snapshot.rows(product.href):
+            owner = self.dedup.claim(row[5], row[4], href=product.href, category=product.category)
+            if owner is not None:
+                logger.error(f'we have saved item with article {row[5]} or barcode {row[4]} '
+                             f'out of {owner[0]} [{owner[1]}]')
+                break
+            rows.append(row)
+        self.goods_writer.write_rows(rows, category=product.category)
+        self.journal.mark_done(product.href, product.category, rows)
+
+    def fetch_card(self, product: Product) -> str:
+        try:
+            return product.fetch(fetcher=self.fetcher, base_url=self.base_url)
+        except Exception:
+            self.metrics.record_error(product.category)
+            raise
+
+    def apply_card(self, product: Product, record: tuple[Card | None, float], index: str = "") -> Product:
+        card, seconds = record
+        self.metrics.record_parse(CARD, seconds)
+        if card is None:
+            self.metrics.record_error(product.category)
+        product.apply_card(card, dedup=self.dedup, index=index)
+        return product
+
+    def write_card(self, product: Product) -> None:
+        rows = self.goods_writer.write(product)
+        self.journal.mark_done(product.href, product.category, rows)
+        if self.snapshot is not None:
+            # only a parsed card replaces what the snapshot knows of the product, a skipped one is fetched next run
+            if product.parsed:
+                self.snapshot.update(product.href, product.category, product.fingerprint, rows)
+            self.delta_writer.write_rows([(product.change,) + row for row in rows])
+        self.metrics.record_product(product.category)
+
+    def parse_all_products_out_of_category(self, catalog_url: str = None, products=None):
+        # products is a stream: every card is fetched, parsed and written the moment its link is known
+        logger.info(f'        Starting to parse products of {catalog_url} category')
+        pipeline = Pipeline(fetch=self.fetch_card, extract=partial(extract_card_page, self.parser_backend),
+                            apply=self.apply_card, write=self.write_card, workers=self.workers,
+                            queue_size=self.queue_size, pool=self.parse_pool)
+        written = pipeline.run(products)
+        logger.info(f'        Done | {written} products from {catalog_url} have been parsed')
+
+    def estimate_pages(self, catalog_url: str) -> int:
+        # the amount of pages of a category is its size for the scheduler, out of the journal if it is known there
+        pages = self.journal.pages(catalog_url)
+        if pages is not None:
+            self.amount_of_pages[catalog_url] = pages
+            logger.info(f'        We know {pages} pages of category {catalog_url} out of the journal')
+            return pages
+        listing = self.get_listing_out_of_page_with_url(self.base_url + catalog_url, params=PAGE_PARAMS,
+                                                        catalog_url=catalog_url)
+        self.calc_amount_of_pages(listing=listing, catalog_url=catalog_url)
+        self.journal.set_pages(catalog_url, self.amount_of_pages[catalog_url])
+        self.first_listings[catalog_url] = listing
+        return self.amount_of_pages[catalog_url]
 
     def parse_cards(self, catalog_url):
         logger.info(f'      Parsing cards out of {catalog_url}')
-        tracemalloc.start()
-        soup = self.get_soup_out_of_page_with_url(ZOO_URL + catalog_url, params={'pc': 50, 'v': 'filling'})
-        self.calc_amount_of_pages(soup=soup, catalog_url=catalog_url)
-        # let's get links of all products in this category
-        self.get_all_products_links_out_of_category(catalog_url=catalog_url)
-        # let's parse all products we have within this category
-        self.parse_all_products_out_of_category(catalog_url=catalog_url)
-        tracemalloc.stop()
+        if catalog_url not in self.amount_of_pages:
+            self.estimate_pages(catalog_url)
+        listing = self.first_listings.pop(catalog_url, None)
+        # links of all products in this category are streamed straight into card parsing
+        products = self.get_all_products_links_out_of_category(catalog_url=catalog_url, listing=listing)
+        self.parse_all_products_out_of_category(catalog_url=catalog_url, products=products)
+        self.metrics.category_done(catalog_url)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            logger.info(f'        Traced memory: {current / 2 ** 20:.1f} MB, peak {peak / 2 ** 20:.1f} MB')
 
-    def csv_write(self):
-        # write categories
+    def parse_links(self, catalog_url: str, links: list[tuple[str, str, str]]):
+        # a shard of product links handed out by the coordinator, the listing has been walked there
+        logger.info(f'      Parsing {len(links)} cards of {catalog_url} out of a shard')
+        self.amount_of_products[catalog_url] = 0
+        products = self.not_parsed_yet(catalog_url, [Product(href, title, category=catalog_url,
+                                                             fingerprint=fingerprint)
+                                                     for href, title, fingerprint in links])
+        self.parse_all_products_out_of_category(catalog_url=catalog_url, products=products)
+        self.metrics.category_done(catalog_url)
+
+    def crawl_category(self, url: str):
+        logger.info(f'  Parsing {url} category')
+        self.parse_all_categories(url)
+        self.parse_cards(url)
 
+    def csv_write(self):
+        # write categories, goods are written by the pipeline while they are being parsed;
+        # what is left of a lazy tree is looked down the way an eager one is built, the pages of a level
+        # all at once, not a page at a time by the walks below
+        if self.lazy_tree:
+            builder = TreeBuilder(engine=self.engine)
+            for root in self.category_parsed_tree.values():
+                builder.build(root)
         with (self.out_dir / 'categories.csv').open('w', encoding='utf-8', newline='') as file:
             writer = csv.writer(file, delimiter=';')
             writer.writerow(headers)
@@ -197,26 +391,88 @@ class Parser:
                 temp_list = [item for item in category.list_of_children()]
                 for cat in temp_list:
                     writer.writerow(cat)
-        # write goods
-        goods_headers = (
-            'price_datetime', 'price', 'price_promo', 'sku_status', 'sku_barcode', 'sku_article', 'sku_name',
-            'sku_category', 'sku_country', 'sku_weight_min', 'sku_volume_min', 'sku_quantity_min', 'sku_link',
-            'sku_images')
-        with (self.out_dir / 'goods.csv').open('w', encoding='utf-8', newline='') as file:
-            writer = csv.writer(file, delimiter=';')
-            writer.writerow(goods_headers)
-            for category in self.required_categories_list:
-                for product in self.products_list_by_category[category]:
-                    writer.writerows(product.to_csv)
+        self.registry.save()
+        if self.tree_discovered:
+            self.tree_snapshot.save(self.category_parsed_tree)
 
-    def work(self):
+    def crawl_categories(self):
+        scheduler = CategoryScheduler(engine=self.engine, workers=self.category_workers)
+        categories = scheduler.run(self.required_categories_list, estimate=self.estimate_pages,
+                                   crawl=self.crawl_category)
+        for done, (url, pages, seconds) in enumerate(categories, start=1):
+            logger.info(f'  Done | Category {url} parsed: {self.amount_of_products.get(url, 0)} products '
+                        f'out of {pages} pages in {seconds:.1f}s '
+                        f'({done}/{len(self.required_categories_list)} categories)')
+
+    def work(self, links: dict[str, list[tuple[str, str, str]]] = None):
+        # whole categories by default, or only the given product links of categories (a shard of a sharded crawl)
         logger.info(f'We have {len(self.required_categories_list)} categories to parse..')
+        if self.trace_memory:
+            tracemalloc.start()
+        self.metrics.start_progress(self.metrics_config['progress_s'])
+        self.metrics.serve(self.metrics_config['prometheus_port'])
+        if self.parse_processes > 0:
+            # card pages are parsed on all the cores, network threads only hand the page text over
+            self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_processes,
+                                                  mp_context=multiprocessing.get_context('spawn'))
+        # a failed run is restarted in the same process, so the pool and the files are let go whatever happens
+        try:
+            if self.snapshot is not None:
+                self.delta_writer = GoodsWriter(self.out_dir / self.incremental['delta_file'], append=self.resume,
+                                                headers=DELTA_HEADERS)
+            with open_sinks(self.out_dir, self.output['formats'], batch_rows=self.output['batch_rows'],
+                            history_file=Path(self.output['history_file'])) as self.goods_writer:
+                if self.resume:
+                    self.restore_from_journal()
+                if links is None:
+                    self.crawl_categories()
+                else:
+                    for url, category_links in links.items():
+                        self.parse_links(url, category_links)
+            if self.snapshot is not None:
+                self.write_removed()
+        finally:
+            if self.delta_writer is not None:
+                self.delta_writer.close()
+                self.delta_writer = None
+            if self.parse_pool is not None:
+                self.parse_pool.shutdown(cancel_futures=True)
+                self.parse_pool = None
+
+    def close(self):
+        # lazy category trees may still be looked down while categories.csv is written, so the network
+        # is closed after that
+        self.engine.shutdown()
+        self.fetcher.close()
+        self.journal.close()
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.metrics.stop()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def write_removed(self):
+        # a category whose listing has not been walked to its end in this run tells nothing of what has gone
+        categories = [url for url in self.required_categories_list if url in self.listed]
         for url in self.required_categories_list:
-            logger.info(f'  Parsing {url} category')
-            self.parse_all_categories(url)
-            self.parse_cards(url)
-            logger.info(f'  Done | Category {url} parsed')
+            if url not in self.listed:
+                logger.warning(f'Listing of {url} has not been loaded in full, its removed products are kept')
+        removed = 0
+        for href, rows in self.snapshot.removed(categories):
+            self.delta_writer.write_rows([(REMOVED,) + row for row in rows])
+            removed += 1
+        logger.info(f'{removed} products have gone out of the listings since the previous run')
+
+    def restore_from_journal(self):
+        # goods.csv is rebuilt out of the journal, so rows written after the last checkpoint are not doubled
+        restored = 0
+        for href, category, rows in self.journal.done_products():
+            self.goods_writer.write_rows(rows, category=category)
+            for row in rows:
+                self.dedup.claim(row[5], row[4], href=href, category=category)
+            restored += 1
+        logger.info(f'Resuming: {restored} products have been restored out of the journal')
 
 
 if __name__ == "__main__":
-    print(get_category_code_by_url("/catalog/tovary-i-korma-dlya-khorkov/aksessuary/"))
+    print(get_category_code_by_url("/catalog/tovary-i-korma-dlya-khorkov/aksessuary/", CategoryRegistry()))
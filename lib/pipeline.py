@@ -0,0 +1,118 @@
+import threading
+from concurrent.futures import BrokenExecutor, Executor, FIRST_COMPLETED, wait
+from queue import Queue
+
+from loguru import logger
+
+STOP = None
+
+
+class Pipeline:
+    # listing stage -> card fetch stage -> parse stage -> goods writer
+    # stages are threads connected by bounded queues, so a slow stage holds back the ones before it
+    # and no more than a few queues worth of products are kept in memory at any moment
+    #
+    # parsing is split in two: extract(text) turns a page into a plain record and may run in a pool of processes,
+    # apply(product, record, index) takes it back into the product (dedup included) in this process
+    def __init__(self, fetch, extract, apply, write, workers: int = 8, queue_size: int = 100, pool: Executor = None):
+        self.fetch = fetch
+        self.extract = extract
+        self.apply = apply
+        self.write = write
+        self.pool = pool
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.errors: list[Exception] = []
+        self.written = 0
+
+    def run(self, products) -> int:
+        self.written = 0
+        links, pages, parsed = Queue(self.queue_size), Queue(self.queue_size), Queue(self.queue_size)
+        threads = [threading.Thread(target=self.listing_stage, args=(products, links), name='listing')]
+        threads += [threading.Thread(target=self.fetch_stage, args=(links, pages), name=f'card-fetch-{i}')
+                    for i in range(self.workers)]
+        threads.append(threading.Thread(target=self.parse_stage, args=(pages, parsed), name='card-parse'))
+        threads.append(threading.Thread(target=self.write_stage, args=(parsed,), name='writer'))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+        return self.written
+
+    def listing_stage(self, products, links: Queue):
+        try:
+            for index, product in enumerate(products, start=1):
+                if product.parsed:
+                    logger.warning(f"We already parsed this product: [{product.title}|{product.href}]")
+                    continue
+                links.put((str(index), product))
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            for _ in range(self.workers):
+                links.put(STOP)
+
+    def fetch_stage(self, links: Queue, pages: Queue):
+        while (item := links.get()) is not STOP:
+            index, product = item
+            try:
+                pages.put((index, product, self.fetch(product)))
+            except Exception as e:
+                logger.error(f'failed to load {product.href}: {e}')
+        pages.put(STOP)
+
+    def parse_stage(self, pages: Queue, parsed: Queue):
+        stopped = 0
+        pending = set()
+        try:
+            while stopped < self.workers:
+                item = pages.get()
+                if item is STOP:
+                    stopped += 1
+                    continue
+                index, product, text = item
+                if self.pool is None:
+                    self.take(product, index, lambda: self.extract(text), parsed)
+                    continue
+                # no more than queue_size pages are in flight in the pool
+                future = self.pool.submit(self.extract, text)
+                future.card_of = (product, index)
+                pending.add(future)
+                if len(pending) >= self.queue_size:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.take(*future.card_of, future.result, parsed)
+            for future in wait(pending).done:
+                self.take(*future.card_of, future.result, parsed)
+        except Exception as e:
+            # a broken pool fails the run; the pages still coming are drained, so the fetch threads can stop
+            self.errors.append(e)
+            for future in pending:
+                future.cancel()
+            while stopped < self.workers:
+                if pages.get() is STOP:
+                    stopped += 1
+        finally:
+            parsed.put(STOP)
+
+    def take(self, product, index: str, record, parsed: Queue):
+        try:
+            self.apply(product, record(), index)
+        except BrokenExecutor:
+            raise
+        except Exception as e:
+            logger.error(f'failed to parse {product.href}: {e}')
+            return
+        parsed.put(product)
+
+    def write_stage(self, parsed: Queue):
+        while (product := parsed.get()) is not STOP:
+            try:
+                self.write(product)
+            except Exception as e:
+                # without the writer the whole run is useless, but the queue must still be drained
+                self.errors.append(e)
+                continue
+            self.written += 1
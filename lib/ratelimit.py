@@ -0,0 +1,93 @@
+import threading
+from email.utils import parsedate_to_datetime
+from random import uniform
+from time import monotonic, sleep, time
+
+from loguru import logger
+
+# the site answers these when it is asked too often, the rate of the host goes down on them
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+RATE_LIMIT = {
+    "initial_rps": 5,
+    "min_rps": 0.2,
+    "max_rps": 50,
+    "increase_rps": 0.5,
+    "decrease": 0.5,
+    "latency_target_s": 2.0,
+    "backoff_base_s": 0.5,
+    "backoff_max_s": 60
+}
+
+
+def retry_after_s(value: str | None) -> float:
+    # Retry-After is either a number of seconds or an http date
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def backoff_s(attempt: int, retry_after: float = 0.0, base_s: float = 0.5, max_s: float = 60) -> float:
+    # exponential backoff with full jitter, never sooner than the site has asked for
+    return max(retry_after, uniform(0, min(max_s, base_s * 2 ** (attempt - 1))))
+
+
+class AdaptiveRate:
+    # token bucket of one host whose rate follows the answers: it grows by increase_rps per second of
+    # fast answers, is cut by `decrease` on 429/503 and by half as much on answers slower than latency_target_s;
+    # Retry-After pauses the whole host
+    def __init__(self, host: str, initial_rps: float, min_rps: float, max_rps: float, increase_rps: float,
+                 decrease: float, latency_target_s: float, burst: float = 1.0, **_):
+        self.host = host
+        # max_rps is the hard cap, a floor above it is brought down to it rather than the cap raised
+        self.max_rps = max_rps
+        self.min_rps = min(min_rps, max_rps)
+        self.rate = min(self.max_rps, max(min_rps, initial_rps))
+        self.increase_rps = increase_rps
+        self.decrease = decrease
+        self.latency_target_s = latency_target_s
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.refill(now)
+                wait = self.paused_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+    def observe(self, seconds: float, status: int, retry_after: float = 0.0):
+        with self.lock:
+            if status in THROTTLE_STATUSES:
+                self.rate = max(self.min_rps, self.rate * self.decrease)
+                self.tokens = 0.0
+                if retry_after > 0:
+                    self.paused_until = max(self.paused_until, monotonic() + retry_after)
+                logger.warning(f'{self.host} answered {status}, rate is down to {self.rate:.2f}/s'
+                               + (f', paused for {retry_after:.1f}s' if retry_after > 0 else ''))
+            elif status >= 500 or seconds > self.latency_target_s:
+                self.rate = max(self.min_rps, self.rate * (1 + self.decrease) / 2)
+            elif status:
+                # additive increase: one increase_rps per `rate` answers, that is about one per second
+                self.rate = min(self.max_rps, self.rate + self.increase_rps / self.rate)
@@ -0,0 +1,54 @@
+import json
+import threading
+from pathlib import Path
+
+from lib.category import STAGES
+
+
+def get_stage_out_of_url(url: str) -> int:
+    parts = len(url[1:-1].split('/'))
+    return parts - 1
+
+
+def get_less_one_level_of_link(url):
+    parts = url[1:-1].split('/')
+    return '/' + '/'.join(parts[:-1]) + '/'
+
+
+class CategoryRegistry:
+    # url -> number among the children of its parent, given once in the order of discovery and kept in a file,
+    # so ids do not depend on crawl order and do not shift between runs
+    # both ways of giving codes (by url and by the tree) go through it
+    def __init__(self, path: Path = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.numbers: dict[str, dict[str, int]] = {}
+        self.changed = False
+        if path is not None and path.exists():
+            self.numbers = json.loads(path.read_text(encoding='utf-8'))
+
+    def number(self, parent_link: str, link: str) -> int:
+        with self.lock:
+            siblings = self.numbers.setdefault(parent_link, {})
+            if link not in siblings:
+                siblings[link] = max(siblings.values(), default=0) + 1
+                self.changed = True
+            return siblings[link]
+
+    def child_code(self, parent_link: str, parent_code: int, parent_stage: int, link: str) -> int:
+        return parent_code + self.number(parent_link, link) * STAGES[parent_stage]['multiplier']
+
+    def code(self, url: str) -> int:
+        stage = get_stage_out_of_url(url)
+        if stage == 0:
+            return 0
+        parent = get_less_one_level_of_link(url)
+        return self.child_code(parent, self.code(parent), stage - 1, url)
+
+    def save(self):
+        if self.path is None or not self.changed:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            self.path.write_text(json.dumps(self.numbers, ensure_ascii=False, indent=1), encoding='utf-8')
+            self.changed = False
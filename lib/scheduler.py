@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter
+
+from loguru import logger
+
+from lib.engine import FetchEngine
+
+
+class CategoryScheduler:
+    # runs whole categories side by side, `workers` of them at a time
+    # the size of every category is estimated first (all the estimates at once on the fetch engine),
+    # then categories are started largest first, so the biggest ones do not end up last and alone;
+    # requests of all the categories still share the per-host slots and the rate of the engine,
+    # which is the request budget of the whole run
+    def __init__(self, engine: FetchEngine, workers: int = 4):
+        self.engine = engine
+        self.workers = max(1, workers)
+
+    def order(self, categories: list[str], estimate) -> list[tuple[str, int]]:
+        sizes = dict(self.engine.run(estimate, categories))
+        return sorted(((category, sizes[category]) for category in categories), key=lambda item: -item[1])
+
+    def run(self, categories: list[str], estimate, crawl):
+        # yields (category, estimated size, seconds) as each category is done;
+        # the first failure cancels the categories not started yet and is raised once the running ones finish
+        ordered = self.order(categories, estimate)
+        logger.info('Categories by size: ' + ', '.join(f'{category} ({size})' for category, size in ordered))
+
+        def timed(category: str) -> float:
+            started = perf_counter()
+            crawl(category)
+            return perf_counter() - started
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='category')
+        futures = {pool.submit(timed, category): (category, size) for category, size in ordered}
+        try:
+            for future in as_completed(futures):
+                category, size = futures[future]
+                yield category, size, future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            pool.shutdown(wait=True)
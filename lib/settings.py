@@ -1,31 +1,134 @@
 import json
-import logging
-import sys
+from functools import lru_cache
+from pathlib import Path
 
-logger = logging.getLogger('main2.settings')
 DEFAULT_CONFIG = 'config.json'
 
+# every key of the config with its type, the config is checked against it once when it is read
+FIELDS = {
+    "output_directory": str,
+    "base_url": str,
+    "categories": list,
+    "delay_range": list,
+    "rate_limit": dict,
+    "workers": int,
+    "category_workers": int,
+    "per_host_limit": int,
+    "pool_size": int,
+    "queue_size": int,
+    "journal_file": str,
+    "cache": dict,
+    "incremental": dict,
+    "parser_backend": str,
+    "parse_processes": int,
+    "lazy_tree": bool,
+    "tree": dict,
+    "output": dict,
+    "trace_memory": bool,
+    "metrics": dict,
+    "shards": dict,
+    "max_retries": int,
+    "headers": dict,
+    "logs_dir": str,
+    "logging": dict,
+    "restart": dict,
+}
+# keys of the config of the first versions, every config has them
+REQUIRED = ("output_directory", "categories", "delay_range", "max_retries", "headers", "logs_dir", "restart")
+# the rest of the keys, and any member of a section, may be left out and fall back to these, the defaults of
+# the parser; rate_limit and logging are laid over lib.ratelimit.RATE_LIMIT and lib.logs.LOGGING where used
+DEFAULTS = {
+    "base_url": "https://zootovary.ru",
+    "rate_limit": {},
+    "workers": 8,
+    "category_workers": 4,
+    "per_host_limit": 4,
+    "pool_size": 8,
+    "queue_size": 100,
+    "journal_file": "out/journal.sqlite",
+    "cache": {"enabled": False, "path": "cache/pages.sqlite", "max_size_mb": 512,
+              "ttl_h": {"menu": 24, "listing": 1, "card": 12}},
+    "incremental": {"enabled": False, "snapshot_file": "out/snapshot.sqlite", "delta_file": "goods-delta.csv"},
+    "parser_backend": "soup",
+    "parse_processes": 0,
+    "lazy_tree": False,
+    "tree": {"snapshot_file": "out/tree.jsonl", "registry_file": "out/category_ids.json", "refresh_h": 24},
+    "output": {"formats": ["csv"], "batch_rows": 500, "history_file": "out/history.sqlite"},
+    "trace_memory": False,
+    "metrics": {"summary_file": "metrics.json", "progress_s": 30, "prometheus_port": 0},
+    "shards": {"queue_file": "out/queue.sqlite", "shard_size": 500, "lease_s": 300, "max_attempts": 3},
+    "logging": {},
+    "restart": {"restart_count": 3, "interval_m": 0.2},
+}
+# at least one of these is needed for a crawl to move at all
+POSITIVE = ("workers", "category_workers", "per_host_limit", "pool_size", "queue_size")
+
+
+def config_errors(settings: dict) -> list[str]:
+    errors = [f'unknown key {key}' for key in settings if key not in FIELDS]
+    errors.extend(f'{key} is missing' for key in REQUIRED if key not in settings)
+    for key, value in settings.items():
+        kind = FIELDS.get(key)
+        if kind is None:
+            continue
+        # bool is an int to python, but not to the config; an int will do where a float is expected
+        if isinstance(value, bool) != (kind is bool) or not isinstance(value, kind):
+            errors.append(f'{key} should be {kind.__name__}, not {type(value).__name__}')
+        elif key in POSITIVE and value < 1:
+            errors.append(f'{key} should be at least 1, not {value}')
+    if isinstance(settings.get('delay_range'), list) and len(settings['delay_range']) != 2:
+        errors.append('delay_range should be [min, max] seconds')
+    return errors
+
+
+def with_defaults(settings: dict) -> dict:
+    # a section of the config is laid over its defaults, so the members it leaves out keep theirs
+    merged = json.loads(json.dumps(DEFAULTS))
+    for key, value in settings.items():
+        merged[key] = {**merged[key], **value} if isinstance(merged.get(key), dict) else value
+    return merged
+
 
 class Settings:
-    __slots__ = (
-        "output_directory",
-        "categories",
-        "delay_range",
-        "max_retries",
-        "headers",
-        "logs_dir",
-        "restart",
-        "provided"
-    )
-
-    def __init__(self):
+    __slots__ = tuple(FIELDS) + ("provided",)
+
+    def __init__(self, config: str = None):
+        self.provided = False
         try:
-            config = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CONFIG
-            settings = json.load(open(config, 'r'))
+            config = config if config else DEFAULT_CONFIG
+            with open(config, 'r') as file:
+                settings = json.load(file)
+            errors = config_errors(settings)
+            if errors:
+                raise ValueError(f'config {config} is not valid: ' + '; '.join(errors))
 
-            for key, value in settings.items():
+            for key, value in with_defaults(settings).items():
                 setattr(self, key, value)
             self.provided = True
 
         except FileNotFoundError as e:
-            logger.error('Config argument found, but no such file found. Exception: ', e)
+            # logging is only loaded for the error, it costs every start of main.py otherwise
+            import logging
+            logging.getLogger('main2.settings').error('Config argument found, but no such file found. '
+                                                      'Exception: %s', e)
+
+    def copy(self, **changes) -> 'Settings':
+        settings = Settings.__new__(Settings)
+        for name in self.__slots__:
+            if hasattr(self, name):
+                setattr(settings, name, getattr(self, name))
+        for name, value in changes.items():
+            setattr(settings, name, value)
+        return settings
+
+
+@lru_cache(maxsize=None)
+def read_settings(path: str, mtime_ns: int) -> Settings:
+    return Settings(config=path)
+
+
+def load_settings(config: str = None) -> Settings:
+    # the config of a process is read and checked once, and again only after the file has changed;
+    # changes of a run go to a copy, see Settings.copy
+    path = Path(config if config else DEFAULT_CONFIG)
+    return read_settings(str(path), path.stat().st_mtime_ns if path.exists() else 0)
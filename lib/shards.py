@@ -0,0 +1,229 @@
+import csv
+import json
+import os
+import socket
+import sqlite3
+import threading
+from collections import namedtuple
+from itertools import groupby
+from pathlib import Path
+from time import time
+
+from loguru import logger
+
+from lib.dedup import DedupIndex
+from lib.sinks import open_sinks
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+CATEGORY, LINKS = 'category', 'links'
+
+Shard = namedtuple('Shard', 'id, kind, category, links, attempts')
+
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class WorkQueue:
+    # shards of a crawl in sqlite: a whole category or a slice of its product links each;
+    # workers, local processes or other boxes sharing the file, take a shard under a lease they keep renewing,
+    # a shard whose lease has run out (its worker died) is given to the next worker that asks
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS shards (id INTEGER PRIMARY KEY, kind TEXT, category TEXT, links TEXT,
+                                               state TEXT, worker TEXT, lease_until REAL, attempts INTEGER,
+                                               output TEXT, error TEXT);
+            CREATE INDEX IF NOT EXISTS shards_state ON shards (state, lease_until);
+        ''')
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM shards')
+
+    def add(self, kind: str, category: str, links: list[tuple[str, str, str]] = None):
+        with self.lock:
+            self.connection.execute('INSERT INTO shards (kind, category, links, state, attempts) '
+                                    'VALUES (?, ?, ?, ?, 0)',
+                                    (kind, category, json.dumps(links, ensure_ascii=False) if links else None,
+                                     PENDING))
+
+    def claim(self, worker: str, lease_s: float) -> Shard | None:
+        now = time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.connection.execute(
+                    'SELECT id, kind, category, links, attempts FROM shards '
+                    'WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY id LIMIT 1',
+                    (PENDING, RUNNING, now)).fetchone()
+                if row is not None:
+                    self.connection.execute('UPDATE shards SET state = ?, worker = ?, lease_until = ?, '
+                                            'attempts = attempts + 1 WHERE id = ?',
+                                            (RUNNING, worker, now + lease_s, row[0]))
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return Shard(row[0], row[1], row[2], [tuple(link) for link in json.loads(row[3])] if row[3] else None,
+                     row[4] + 1)
+
+    def renew(self, shard_id: int, worker: str, lease_s: float):
+        with self.lock:
+            self.connection.execute('UPDATE shards SET lease_until = ? WHERE id = ? AND worker = ? AND state = ?',
+                                    (time() + lease_s, shard_id, worker, RUNNING))
+
+    def done(self, shard_id: int, output: str):
+        with self.lock:
+            self.connection.execute('UPDATE shards SET state = ?, output = ?, error = NULL WHERE id = ?',
+                                    (DONE, output, shard_id))
+
+    def fail(self, shard_id: int, error: str, max_attempts: int):
+        # the shard goes back to the queue until it has failed max_attempts times
+        with self.lock:
+            self.connection.execute('UPDATE shards SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, '
+                                    'error = ?, lease_until = NULL WHERE id = ?',
+                                    (max_attempts, FAILED, PENDING, error, shard_id))
+
+    def progress(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.connection.execute('SELECT state, COUNT(*) FROM shards GROUP BY state'))
+
+    def outputs(self) -> list[tuple[int, str, str]]:
+        with self.lock:
+            return list(self.connection.execute('SELECT id, category, output FROM shards WHERE state = ? ORDER BY id',
+                                                (DONE,)))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class Lease:
+    # keeps the lease of a shard alive while its worker is busy with it
+    def __init__(self, queue: WorkQueue, shard: Shard, worker: str, lease_s: float):
+        self.queue = queue
+        self.shard = shard
+        self.worker = worker
+        self.lease_s = lease_s
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.keep, name=f'lease-{shard.id}', daemon=True)
+
+    def keep(self):
+        while not self.stop.wait(self.lease_s / 3):
+            self.queue.renew(self.shard.id, self.worker, self.lease_s)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop.set()
+        self.thread.join()
+
+
+def split(parser, queue: WorkQueue, mode: str = CATEGORY, shard_size: int = 500) -> int:
+    # the coordinator: category trees and categories.csv are done here once, the products are left to the workers,
+    # either a whole category per shard or its product links shard_size at a time
+    queue.clear()
+    for url in parser.required_categories_list:
+        parser.parse_all_categories(url)
+    parser.csv_write()
+    shards = 0
+    for url in parser.required_categories_list:
+        if mode == CATEGORY:
+            queue.add(CATEGORY, url)
+            shards += 1
+            continue
+        parser.estimate_pages(url)
+        links = [(product.href, product.title, product.fingerprint) for product in
+                 parser.get_all_products_links_out_of_category(catalog_url=url,
+                                                               listing=parser.first_listings.pop(url, None))]
+        for start in range(0, len(links), shard_size):
+            queue.add(LINKS, url, links[start:start + shard_size])
+            shards += 1
+    logger.info(f'{shards} shards of {len(parser.required_categories_list)} categories are in the queue')
+    return shards
+
+
+def merge(queue: WorkQueue, out_dir: Path, formats: list[str], batch_rows: int = 1000,
+          history_file: Path = None) -> tuple[int, int]:
+    # goods of all the shards in one output; a product claims its articles and barcodes offer by offer,
+    # the way Product.apply_card does, and is cut at its first offer claimed by a product merged before
+    progress = queue.progress()
+    if progress.get(DONE, 0) < sum(progress.values()):
+        logger.warning(f'Merging {progress.get(DONE, 0)} done shards out of {sum(progress.values())}: {progress}')
+    dedup = DedupIndex()
+    written = skipped = 0
+    with open_sinks(out_dir, formats, batch_rows=batch_rows, history_file=history_file) as sinks:
+        for shard_id, category, output in queue.outputs():
+            with (Path(output) / 'goods.csv').open(encoding='utf-8', newline='') as file:
+                rows = csv.reader(file, delimiter=';')
+                next(rows, None)
+                # rows of a product are written together, its link is the 13th column
+                for href, product_rows in groupby(rows, key=lambda row: row[12]):
+                    kept = []
+                    for row in product_rows:
+                        owner = dedup.claim(row[5], row[4], href=href, category=category)
+                        if owner is not None:
+                            skipped += 1
+                            logger.error(f'we have saved item with article {row[5]} or barcode {row[4]} '
+                                         f'out of {owner[0]} [{owner[1]}]')
+                            break
+                        kept.append(tuple(row))
+                    sinks.write_rows(kept, category=category)
+                    written += len(kept)
+    logger.info(f'{written} rows of {len(queue.outputs())} shards merged into {out_dir}, {skipped} duplicates')
+    return written, skipped
+
+
+def coordinator_settings(settings):
+    # the coordinator only plans: the journal of the last run stays for export and the listing snapshot
+    # is left to the run that fetches the cards, so it gets a journal of its own and no incremental mode
+    out_dir = Path(settings.output_directory) / 'shards'
+    return settings.copy(journal_file=str(out_dir / 'coordinator-journal.sqlite'),
+                         incremental={**settings.incremental, 'enabled': False},
+                         metrics={**settings.metrics, 'prometheus_port': 0})
+
+
+def shard_settings(settings, shard: Shard):
+    # a shard is crawled by a parser of its own with its own journal and a plain goods.csv to merge
+    out_dir = Path(settings.output_directory) / 'shards' / f'shard-{shard.id:05}'
+    return settings.copy(output_directory=str(out_dir), categories=[shard.category],
+                         journal_file=str(out_dir / 'journal.sqlite'),
+                         output={**settings.output, 'formats': ['csv']},
+                         incremental={**settings.incremental, 'enabled': False},
+                         metrics={**settings.metrics, 'prometheus_port': 0})
+
+
+def run_worker(settings, queue: WorkQueue, worker: str = None, lease_s: float = 300, max_attempts: int = 3,
+               offline: bool = False) -> int:
+    # takes shards until the queue is empty; a shard taken over after a failure resumes out of its journal
+    from lib.parser import Parser
+
+    worker = worker or worker_name()
+    done = 0
+    while (shard := queue.claim(worker, lease_s)) is not None:
+        config = shard_settings(settings, shard)
+        journal = Path(config.journal_file)
+        logger.info(f'[{worker}] shard {shard.id}: {shard.kind} {shard.category}, attempt {shard.attempts}')
+        parser = Parser(settings=config, resume=journal.exists(), offline=offline)
+        parser.setup_session()
+        try:
+            with Lease(queue, shard, worker, lease_s):
+                parser.work(links={shard.category: shard.links} if shard.kind == LINKS else None)
+            queue.done(shard.id, config.output_directory)
+            done += 1
+        except Exception as e:
+            logger.exception(f'[{worker}] shard {shard.id} failed: {e}')
+            queue.fail(shard.id, repr(e), max_attempts)
+        finally:
+            parser.metrics.write(parser.out_dir / parser.metrics_config['summary_file'])
+            parser.close()
+    logger.info(f'[{worker}] no shards left, {done} done by this worker, queue: {queue.progress()}')
+    return done
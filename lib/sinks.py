@@ -0,0 +1,220 @@
+import csv
+import gzip
+import io
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from lib.history import PriceHistory
+from lib.normalize import NORMALIZED, normalize_offers
+from lib.writer import GOODS_HEADERS, GoodsWriter
+
+if TYPE_CHECKING:
+    from lib.product import Product
+
+FORMATS = ('csv', 'csv.gz', 'csv.zst', 'parquet', 'arrow', 'history')
+
+
+def category_partition(category: str) -> str:
+    # /catalog/tovary-i-korma-dlya-sobak/korm-sukhoy/ -> tovary-i-korma-dlya-sobak.korm-sukhoy
+    parts = [part for part in category.split('/') if part]
+    if parts and parts[0] == 'catalog':
+        parts = parts[1:]
+    return '.'.join(parts) or 'catalog'
+
+
+# compressed csv and columnar outputs are optional: zstandard and pyarrow are only needed, and only imported,
+# when the corresponding format is asked for
+def require_pyarrow(fmt: str):
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(f'{fmt} output needs pyarrow: pip install pyarrow') from None
+    return pyarrow
+
+
+def goods_schema():
+    # goods columns with their types, then the columns added by normalize_offers
+    pyarrow = require_pyarrow('columnar')
+    types = {'price_datetime': pyarrow.timestamp('us'), 'price': pyarrow.float64(),
+             'price_promo': pyarrow.float64(), 'sku_status': pyarrow.int8(), 'quantity': pyarrow.float64(),
+             'price_per_unit': pyarrow.float64()}
+    return pyarrow.schema([(name, types.get(name, pyarrow.string())) for name in GOODS_HEADERS + NORMALIZED])
+
+
+def goods_table(rows: list[tuple], schema):
+    # rows become string columns once, everything else is done on the columns by normalize_offers
+    pyarrow = require_pyarrow('columnar')
+    columns = {name: pyarrow.array(['' if row[i] is None else str(row[i]) for row in rows], pyarrow.string())
+               for i, name in enumerate(GOODS_HEADERS)}
+    columns = normalize_offers(columns)
+    return pyarrow.Table.from_arrays([columns[name] for name in schema.names], schema=schema)
+
+
+class CompressedCsvSink:
+    # goods.csv.gz or goods.csv.zst: rows are gathered and compressed batch_rows at a time
+    def __init__(self, path: Path, compression: str = 'gz', batch_rows: int = 1000, headers: tuple = GOODS_HEADERS):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if compression == 'zst':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError('csv.zst output needs zstandard: pip install zstandard') from None
+            self.stream = zstandard.ZstdCompressor(level=6).stream_writer(path.open('wb'))
+        else:
+            self.stream = gzip.open(path, 'wb', compresslevel=6)
+        self.lock = threading.Lock()
+        self.batch_rows = max(1, batch_rows)
+        self.pending: list[tuple] = [headers]
+        self.rows = 0
+
+    def write_rows(self, rows: list[tuple], category: str = ''):
+        with self.lock:
+            self.pending.extend(rows)
+            self.rows += len(rows)
+            if len(self.pending) >= self.batch_rows:
+                self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=';').writerows(self.pending)
+        self.stream.write(buffer.getvalue().encode('utf-8'))
+        self.pending = []
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.stream.close()
+
+
+class ArrowSink:
+    # typed and normalized goods partitioned by run date and category:
+    #   out/parquet/run_date=2024-01-31/category=tovary-i-korma-dlya-sobak/goods.parquet
+    # every batch of a partition becomes a row group (parquet) or a record batch (arrow) of its file
+    def __init__(self, directory: Path, fmt: str = 'parquet', run_date: str = None, batch_rows: int = 1000):
+        self.pyarrow = require_pyarrow(fmt)
+        self.directory = directory / f'run_date={run_date or datetime.now().date().isoformat()}'
+        self.fmt = fmt
+        self.schema = goods_schema()
+        self.lock = threading.Lock()
+        self.batch_rows = max(1, batch_rows)
+        self.pending: dict[str, list[tuple]] = {}
+        self.writers = {}
+        self.rows = 0
+
+    def write_rows(self, rows: list[tuple], category: str = ''):
+        partition = category_partition(category)
+        with self.lock:
+            pending = self.pending.setdefault(partition, [])
+            pending.extend(rows)
+            self.rows += len(rows)
+            if len(pending) >= self.batch_rows:
+                self.flush(partition)
+
+    def writer(self, partition: str):
+        if partition not in self.writers:
+            path = self.directory / f'category={partition}' / f'goods.{self.fmt}'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if self.fmt == 'parquet':
+                self.writers[partition] = self.pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+            else:
+                self.writers[partition] = self.pyarrow.ipc.new_file(str(path), self.schema)
+        return self.writers[partition]
+
+    def flush(self, partition: str):
+        rows = self.pending.pop(partition, [])
+        if rows:
+            self.writer(partition).write_table(goods_table(rows, self.schema))
+
+    def close(self):
+        with self.lock:
+            for partition in list(self.pending):
+                self.flush(partition)
+            for writer in self.writers.values():
+                writer.close()
+
+
+class HistorySink:
+    # offers of the run go to the price history store, batch_rows rows in a transaction
+    def __init__(self, path: Path, batch_rows: int = 1000):
+        self.history = PriceHistory(path)
+        self.lock = threading.Lock()
+        self.batch_rows = max(1, batch_rows)
+        self.pending: dict[str, list[tuple]] = {}
+        self.rows = 0
+        self.changed = 0
+
+    def write_rows(self, rows: list[tuple], category: str = ''):
+        with self.lock:
+            self.pending.setdefault(category, []).extend(rows)
+            self.rows += len(rows)
+            if sum(len(pending) for pending in self.pending.values()) >= self.batch_rows:
+                self.flush()
+
+    def flush(self):
+        for category, rows in self.pending.items():
+            self.changed += self.history.ingest(rows, category=category)
+        self.pending = {}
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.history.close()
+
+
+class GoodsSinks:
+    # every goods row goes to each of the configured outputs
+    def __init__(self, sinks: list):
+        self.sinks = sinks
+
+    @property
+    def rows(self) -> int:
+        return self.sinks[0].rows if self.sinks else 0
+
+    def write(self, product: 'Product') -> list[tuple]:
+        rows = list(product.to_csv)
+        self.write_rows(rows, category=product.category)
+        return rows
+
+    def write_rows(self, rows: list[tuple], category: str = ''):
+        for sink in self.sinks:
+            sink.write_rows(rows, category=category)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_sinks(out_dir: Path, formats: list[str], batch_rows: int = 1000, run_date: str = None,
+               history_file: Path = None) -> GoodsSinks:
+    # the price history is kept over the runs, out/history.sqlite unless another file is given
+    sinks = []
+    try:
+        for fmt in formats:
+            if fmt == 'csv':
+                sinks.append(GoodsWriter(out_dir / 'goods.csv', batch_rows=batch_rows))
+            elif fmt in ('csv.gz', 'csv.zst'):
+                sinks.append(CompressedCsvSink(out_dir / f'goods.{fmt}', compression=fmt.split('.')[1],
+                                               batch_rows=batch_rows))
+            elif fmt in ('parquet', 'arrow'):
+                sinks.append(ArrowSink(out_dir / fmt, fmt=fmt, run_date=run_date, batch_rows=batch_rows))
+            elif fmt == 'history':
+                sinks.append(HistorySink(history_file or out_dir / 'history.sqlite', batch_rows=batch_rows))
+            else:
+                raise ValueError(f'unknown output format {fmt}, expected some of: {", ".join(FORMATS)}')
+    except Exception:
+        for sink in sinks:
+            sink.close()
+        raise
+    return GoodsSinks(sinks)
@@ -0,0 +1,73 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from time import time
+
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+
+class ListingSnapshot:
+    # listing fingerprints and written rows of every product of the previous runs
+    # a product is fetched again only when it is new or its fingerprint has changed
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS products (href TEXT PRIMARY KEY, category TEXT, fingerprint TEXT,
+                                                 rows TEXT, seen REAL);
+            CREATE INDEX IF NOT EXISTS products_category ON products (category, seen);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL);
+        ''')
+        self.run = None
+
+    def begin_run(self, resume: bool = False):
+        # a resumed run keeps the id of the run it continues, so products seen before the failure stay seen
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'run'").fetchone()
+            self.run = row[0] if resume and row else time()
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('run', ?)", (self.run,))
+            self.connection.commit()
+
+    def change(self, href: str, fingerprint: str) -> str | None:
+        with self.lock:
+            row = self.connection.execute('SELECT fingerprint, rows FROM products WHERE href = ?', (href,)).fetchone()
+        if row is None or row[1] is None:
+            return ADDED
+        return None if row[0] == fingerprint else CHANGED
+
+    def rows(self, href: str) -> list[tuple]:
+        with self.lock:
+            row = self.connection.execute('SELECT rows FROM products WHERE href = ?', (href,)).fetchone()
+        return [tuple(item) for item in json.loads(row[0])] if row and row[0] else []
+
+    def seen(self, href: str):
+        with self.lock:
+            self.connection.execute('UPDATE products SET seen = ? WHERE href = ?', (self.run, href))
+            self.connection.commit()
+
+    def update(self, href: str, category: str, fingerprint: str, rows: list[tuple]):
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)',
+                                    (href, category, fingerprint,
+                                     json.dumps(rows, ensure_ascii=False, default=str), self.run))
+            self.connection.commit()
+
+    def removed(self, categories: list[str]):
+        # yields (href, rows) of products of the crawled categories that have not been seen in this run
+        # and forgets them
+        for category in categories:
+            with self.lock:
+                records = self.connection.execute('SELECT href, rows FROM products WHERE category = ? AND seen < ?',
+                                                  (category, self.run)).fetchall()
+                self.connection.execute('DELETE FROM products WHERE category = ? AND seen < ?', (category, self.run))
+                self.connection.commit()
+            for href, rows in records:
+                yield href, [tuple(item) for item in json.loads(rows)] if rows else []
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
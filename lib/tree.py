@@ -0,0 +1,81 @@
+import json
+from pathlib import Path
+from time import time
+
+from loguru import logger
+
+from lib.category import Category
+from lib.engine import FetchEngine
+from lib.fetcher import Fetcher
+
+
+class TreeBuilder:
+    # discovers the category tree level by level: pages of all the nodes of a level are fetched at once,
+    # then every node of the level builds its children out of its page or out of the menu of its parent
+    def __init__(self, engine: FetchEngine):
+        self.engine = engine
+
+    def build(self, root: Category, depth: int = None) -> Category:
+        level = [root]
+        stage = 0
+        while level and (depth is None or stage < depth):
+            to_load = [node for node in level if not node.expanded and node.needs_page()]
+            for _ in self.engine.run(lambda node: node.load_page(), to_load):
+                pass
+            next_level = []
+            for node in level:
+                node.expand()
+                next_level.extend(node.child_nodes.values())
+            logger.info(f'    Level {root.stage + stage}: {len(level)} categories, {len(to_load)} pages loaded')
+            level = next_level
+            stage += 1
+        return root
+
+
+class TreeSnapshot:
+    # the discovered trees as json lines (root, link, parent, code, parent_id, title, stage),
+    # loaded back at startup instead of walking the site while the snapshot is younger than refresh_h
+    def __init__(self, path: Path, refresh_h: float = 24):
+        self.path = path
+        self.refresh_h = refresh_h
+        self.rows: dict[str, list[dict]] = {}
+        if self.fresh():
+            with self.path.open(encoding='utf-8') as file:
+                for line in file:
+                    row = json.loads(line)
+                    self.rows.setdefault(row['root'], []).append(row)
+
+    def fresh(self) -> bool:
+        return self.path.exists() and time() - self.path.stat().st_mtime < self.refresh_h * 3600
+
+    def load(self, root_link: str, base_url: str, fetcher: Fetcher = None, registry=None) -> Category | None:
+        if root_link not in self.rows:
+            return None
+        nodes: dict[str, Category] = {}
+        for row in self.rows[root_link]:
+            node = Category(stage=row['stage'], title=row['title'], url=base_url + row['link'], base_url=base_url,
+                            link=row['link'], code=row['code'], parent_id=row['parent_id'], fetcher=fetcher,
+                            lazy=True, registry=registry)
+            node.expanded = node.page_loaded = True
+            if row['parent'] in nodes:
+                nodes[row['parent']].child_nodes[row['link']] = node
+            nodes.setdefault(row['link'], node)
+        return nodes[root_link]
+
+    def save(self, trees: dict[str, Category]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open('w', encoding='utf-8') as file:
+            for root_link, root in trees.items():
+                for node, parent in self.walk(root):
+                    file.write(json.dumps({'root': root_link, 'link': node.link, 'parent': parent, 'code': node.code,
+                                           'parent_id': node.parent_id, 'title': node.title, 'stage': node.stage},
+                                          ensure_ascii=False) + '\n')
+
+    @staticmethod
+    def walk(root: Category):
+        # parents go before their children, so the tree can be rebuilt in one pass
+        stack = [(root, None)]
+        while stack:
+            node, parent = stack.pop()
+            yield node, parent
+            stack.extend((child, node.link) for child in reversed(list(node.children.values())))
@@ -0,0 +1,56 @@
+import csv
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+# Product is only named in annotations: the outputs are also opened by commands that never parse a page
+if TYPE_CHECKING:
+    from lib.product import Product
+
+
+GOODS_HEADERS = (
+    'price_datetime', 'price', 'price_promo', 'sku_status', 'sku_barcode', 'sku_article', 'sku_name',
+    'sku_category', 'sku_country', 'sku_weight_min', 'sku_volume_min', 'sku_quantity_min', 'sku_link',
+    'sku_images')
+# delta of an incremental run: added, changed or removed in front of the goods row
+DELTA_HEADERS = ('change',) + GOODS_HEADERS
+
+
+class GoodsWriter:
+    # writes rows of each product the moment it is parsed and flushes them every batch_rows rows
+    # (every product with 0), whatever has been parsed before a crash is restored out of the journal
+    def __init__(self, path: Path, append: bool = False, headers: tuple = GOODS_HEADERS, batch_rows: int = 0):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        write_headers = not append or not path.exists() or path.stat().st_size == 0
+        self.file = path.open('a' if append else 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file, delimiter=';')
+        if write_headers:
+            self.writer.writerow(headers)
+        self.rows = 0
+        self.batch_rows = batch_rows
+        self.pending = 0
+
+    def write(self, product: 'Product') -> list[tuple]:
+        rows = list(product.to_csv)
+        self.write_rows(rows, category=product.category)
+        return rows
+
+    def write_rows(self, rows: list[tuple], category: str = ''):
+        # unchanged products of an incremental run are written straight out of the listing stage
+        with self.lock:
+            self.writer.writerows(rows)
+            self.rows += len(rows)
+            self.pending += len(rows)
+            if self.pending >= self.batch_rows:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()